@@ -6,23 +6,1629 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from docx import Document
 from docx.shared import Inches
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
 from wordcloud import WordCloud
 from thefuzz import process
+import numpy as np
 from datetime import date, datetime
 import re
+import unicodedata
 import webbrowser
+import io
+import json
+import time
+import hashlib
+import hmac
+import threading
+import queue
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Sin pyarrow las fuentes se vuelven a parsear en cada ejecución
+    pa = None
+    feather = None
+
+try:
+    import xlsxwriter
+except ImportError:  # Sin xlsxwriter el modo streaming escribe con openpyxl
+    xlsxwriter = None
 
 plt.switch_backend('Agg')  # Para evitar problemas con la interfaz gráfica
 
+
+class JobCancelled(BaseException):
+    """Se lanza en el hilo de trabajo cuando el usuario cancela la tarea.
+
+    Hereda de BaseException para atravesar los ``except Exception`` de las acciones.
+    """
+
+
+class Job:
+    """Estado de una tarea en ejecución: etapas, tiempos y cancelación"""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.fin = None
+        self.etapa = None
+        self.inicio_etapa = self.inicio
+        self.tiempos = []
+        self._cancelado = threading.Event()
+
+    def cancel(self):
+        self._cancelado.set()
+
+    @property
+    def cancelado(self):
+        return self._cancelado.is_set()
+
+    def check_cancelled(self):
+        if self._cancelado.is_set():
+            raise JobCancelled()
+
+    def stage(self, nombre):
+        """Cierra la etapa actual, registra su duración y abre la siguiente"""
+        self.check_cancelled()
+        self._cerrar_etapa()
+        self.etapa = nombre
+        self.inicio_etapa = time.perf_counter()
+        print(f"⏳ {self.nombre}: {nombre}")
+
+    def _cerrar_etapa(self):
+        if self.etapa is not None:
+            self.tiempos.append((self.etapa, time.perf_counter() - self.inicio_etapa))
+            self.etapa = None
+
+    def finish(self):
+        self._cerrar_etapa()
+        self.fin = time.perf_counter()
+
+    def transcurrido(self):
+        return (self.fin or time.perf_counter()) - self.inicio
+
+    def resumen(self):
+        return ", ".join(f"{etapa} {segundos:.1f}s" for etapa, segundos in self.tiempos)
+
+
+class JobRunner:
+    """Ejecuta las acciones largas en un hilo de trabajo sin bloquear el mainloop de Tk.
+
+    El hilo de trabajo nunca toca widgets: publica funciones en una cola que el
+    hilo de la interfaz vacía periódicamente con ``root.after``. ``call`` espera
+    el resultado, lo que permite usar diálogos modales desde la tarea.
+    """
+
+    INTERVALO_MS = 50
+
+    def __init__(self, root):
+        self.root = root
+        self.cola = queue.Queue()
+        self.job = None
+        self._hilo_ui = threading.current_thread()
+        self.root.after(self.INTERVALO_MS, self._procesar_cola)
+
+    def en_hilo_ui(self):
+        return threading.current_thread() is self._hilo_ui
+
+    @property
+    def ocupado(self):
+        return self.job is not None and self.job.fin is None
+
+    def post(self, funcion, *args, **kwargs):
+        """Encola una función para el hilo de la interfaz sin esperar su resultado"""
+        self.cola.put((funcion, args, kwargs, None))
+
+    def call(self, funcion, *args, **kwargs):
+        """Ejecuta una función en el hilo de la interfaz y devuelve su resultado"""
+        if self.en_hilo_ui():
+            return funcion(*args, **kwargs)
+        respuesta = {'listo': threading.Event()}
+        self.cola.put((funcion, args, kwargs, respuesta))
+        respuesta['listo'].wait()
+        if 'error' in respuesta:
+            raise respuesta['error']
+        return respuesta.get('valor')
+
+    def _procesar_cola(self):
+        try:
+            while True:
+                funcion, args, kwargs, respuesta = self.cola.get_nowait()
+                try:
+                    valor = funcion(*args, **kwargs)
+                    if respuesta is not None:
+                        respuesta['valor'] = valor
+                except Exception as e:
+                    if respuesta is None:
+                        print(f"❌ Error en la interfaz: {e}")
+                    else:
+                        respuesta['error'] = e
+                finally:
+                    if respuesta is not None:
+                        respuesta['listo'].set()
+        except queue.Empty:
+            pass
+        self.root.after(self.INTERVALO_MS, self._procesar_cola)
+
+    def start(self, nombre, funcion, al_terminar=None):
+        """Lanza ``funcion`` en un hilo de trabajo; devuelve False si ya hay una tarea activa"""
+        if self.ocupado:
+            return False
+        job = Job(nombre)
+        self.job = job
+        
+        def ejecutar():
+            try:
+                funcion()
+            except JobCancelled:
+                print(f"🛑 Tarea cancelada: {nombre}")
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                print(f"❌ Error no controlado en {nombre}: {e}")
+            finally:
+                job.finish()
+                if al_terminar:
+                    self.post(al_terminar, job)
+        
+        threading.Thread(target=ejecutar, name=f"job-{nombre}", daemon=True).start()
+        return True
+
+    def stage(self, nombre):
+        """Marca una nueva etapa de la tarea activa (solo desde su hilo de trabajo)"""
+        if self.job is not None and not self.en_hilo_ui():
+            self.job.stage(nombre)
+
+    def check_cancelled(self):
+        if self.job is not None and not self.en_hilo_ui():
+            self.job.check_cancelled()
+
+    def cancel(self):
+        if self.ocupado:
+            self.job.cancel()
+
+
+def convert_periods(serie):
+    """Convierte una columna completa de timestamps a formato YYYY-Q en una sola pasada.
+
+    Equivale a aplicar ``convert_timestamp_to_period`` fila por fila: los textos
+    que ya contienen '-' se conservan, los nulos o no convertibles quedan en None.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        fechas = serie
+        conservar = pd.Series(False, index=serie.index)
+    else:
+        es_texto = serie.map(type).eq(str)
+        conservar = es_texto & serie.where(es_texto, '').astype(str).str.contains('-', regex=False)
+        fechas = pd.to_datetime(serie.where(~conservar), errors='coerce', format='mixed')
+    
+    periodos = (fechas.dt.year.astype('Int64').astype(str) + '-' +
+                fechas.dt.quarter.astype('Int64').astype(str))
+    periodos = periodos.astype(object).where(fechas.notna(), None)
+    return periodos.where(~conservar, serie)
+
+
+class PeriodPartition:
+    """Posiciones de las filas de una tabla agrupadas por período.
+
+    Se construye una vez por carga; seleccionar un período es una búsqueda en
+    un diccionario en lugar de recorrer toda la columna con una máscara.
+    """
+
+    def __init__(self, df, columna):
+        if columna not in df.columns:
+            raise KeyError(columna)
+        self.df = df
+        self.columna = columna
+        self.posiciones = df.groupby(columna, sort=False).indices
+
+    def periodos(self):
+        return list(self.posiciones)
+
+    def select(self, periodo):
+        """Filas del período (tabla vacía con las mismas columnas si no hay ninguna)"""
+        return self.df.iloc[self.posiciones.get(periodo, [])]
+
+
+def normalize_text(serie):
+    """Normaliza una columna de textos: sin tildes, en minúsculas y con espacios simples"""
+    return (serie.fillna('').astype(str)
+            .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.casefold().str.split().str.join(' '))
+
+
+def normalize_key(texto):
+    """Versión de ``normalize_text`` para un solo valor"""
+    if texto is None or (not isinstance(texto, str) and pd.isna(texto)):
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(texto.casefold().split())
+
+
+def normalize_id(serie):
+    """Normaliza una columna de cédulas: solo letras y dígitos, sin el '.0' de los números
+    leídos como float y con el cero inicial que Excel suele quitar a las cédulas de 9 dígitos"""
+    texto = (serie.astype('string').str.strip().str.replace(r'\.0+$', '', regex=True)
+             .str.upper().str.replace(r'[^0-9A-Z]', '', regex=True))
+    texto = texto.mask(texto.str.fullmatch(r'\d{9}').fillna(False), '0' + texto)
+    return texto.fillna('').astype(object)
+
+
+class LocationIndex:
+    """Índice de la base de ubicaciones por nombre de institución normalizado.
+
+    Las diferencias de mayúsculas, tildes o espacios no pierden coordenadas; si
+    la clave no existe se busca la más parecida (una sola vez por nombre) y el
+    resultado queda como alias. Solo se comparan nombres con los mismos números
+    ("Escuela Fiscal No 13" nunca toma las coordenadas de la No 12). Posiciones
+    y alias se guardan junto a la instantánea de ubicaciones.
+    """
+
+    UMBRAL_DIFUSO = 90
+
+    def __init__(self, df_ubicacion, columna='INSTITUCIÓN', guardado=None):
+        self.df = df_ubicacion.reset_index(drop=True)
+        self.columna = columna
+        guardado = guardado or {}
+        if 'posiciones' in guardado:
+            self.posiciones = guardado['posiciones']
+        else:
+            self.posiciones = {}
+            for posicion, clave in enumerate(normalize_text(self.df[columna])):
+                if clave and clave not in self.posiciones:
+                    self.posiciones[clave] = posicion
+        # Clave consultada -> clave del índice ('' si no hubo coincidencia suficiente)
+        alias = guardado.get('alias', {})
+        self.alias = {clave: destino for clave, destino in alias.items()
+                      if not destino or self._numeros(clave) == self._numeros(destino)}
+        self.modificado = 'posiciones' not in guardado or len(self.alias) != len(alias)
+        self._por_numeros = None
+
+    @staticmethod
+    def _numeros(clave):
+        return tuple(int(numero) for numero in re.findall(r'\d+', clave))
+
+    def to_dict(self):
+        return {'posiciones': self.posiciones, 'alias': self.alias}
+
+    def resolve(self, clave):
+        """Devuelve la clave del índice que corresponde a una clave normalizada"""
+        if not clave or clave in self.posiciones:
+            return clave
+        if clave not in self.alias:
+            if self._por_numeros is None:
+                self._por_numeros = {}
+                for candidata in self.posiciones:
+                    self._por_numeros.setdefault(self._numeros(candidata), []).append(candidata)
+            candidatas = self._por_numeros.get(self._numeros(clave), [])
+            coincidencia = process.extractOne(clave, candidatas, score_cutoff=self.UMBRAL_DIFUSO) if candidatas else None
+            self.alias[clave] = coincidencia[0] if coincidencia else ''
+            self.modificado = True
+            if coincidencia:
+                print(f"🔎 Ubicación por similitud: '{clave}' → '{coincidencia[0]}' ({coincidencia[1]})")
+        return self.alias[clave]
+
+    def positions(self, serie):
+        """Posición en la base de ubicaciones de cada nombre de la serie (-1 si no hay)"""
+        claves = normalize_text(serie)
+        mapa = {clave: self.posiciones.get(self.resolve(clave), -1) for clave in claves.unique()}
+        return claves.map(mapa).to_numpy()
+
+    def lookup(self, serie, columnas):
+        """Columnas de ubicación alineadas fila a fila con la serie (NaN donde no hay coincidencia)"""
+        return self.df[columnas].reindex(self.positions(serie)).reset_index(drop=True)
+
+    def join(self, df, columna):
+        """Equivale a ``df.merge(ubicaciones, how='left', left_on=columna, right_on='INSTITUCIÓN')``
+        pero emparejando por clave normalizada y sin duplicar filas"""
+        izquierda = df.reset_index(drop=True)
+        derecha = self.lookup(df[columna], list(self.df.columns))
+        comunes = set(izquierda.columns) & set(derecha.columns)
+        if comunes:
+            izquierda = izquierda.rename(columns={c: f"{c}_x" for c in comunes})
+            derecha = derecha.rename(columns={c: f"{c}_y" for c in comunes})
+        return pd.concat([izquierda, derecha], axis=1)
+
+
+class StudentSearchIndex:
+    """Índice de búsqueda por nombre de estudiante, construido una vez por carga de datos.
+
+    Guarda los nombres sin tildes ni mayúsculas y un índice invertido de
+    trigramas. La búsqueda exacta intersecta las listas de los trigramas de la
+    consulta; la difusa solo puntúa los nombres que comparten más trigramas.
+    """
+
+    MAX_CANDIDATOS = 200
+    UMBRAL_DIFUSO = 60
+
+    def __init__(self, nombres):
+        self.normalizados = normalize_text(nombres).to_numpy(dtype=object)
+        serie = pd.Series(self.normalizados)
+        self.posiciones_por_nombre = serie.groupby(serie, sort=False).indices
+        
+        # Índice invertido trigrama -> posiciones (ordenadas), construido columna a columna
+        largos = serie.str.len().to_numpy()
+        trigramas, posiciones = [], []
+        for inicio in range(max(int(largos.max(initial=0)) - 2, 0)):
+            validas = np.flatnonzero(largos >= inicio + 3)
+            trigramas.append(serie.iloc[validas].str.slice(inicio, inicio + 3).to_numpy())
+            posiciones.append(validas)
+        self.trigramas = {}
+        if trigramas:
+            codigos, unicos = pd.factorize(np.concatenate(trigramas))
+            posiciones = np.concatenate(posiciones)
+            orden = np.lexsort((posiciones, codigos))
+            codigos, posiciones = codigos[orden], posiciones[orden]
+            # Un nombre que repite un trigrama solo cuenta una vez en su lista
+            nuevas = np.ones(len(posiciones), dtype=bool)
+            nuevas[1:] = (codigos[1:] != codigos[:-1]) | (posiciones[1:] != posiciones[:-1])
+            codigos, posiciones = codigos[nuevas], posiciones[nuevas]
+            cortes = np.flatnonzero(np.diff(codigos)) + 1
+            self.trigramas = dict(zip(unicos[codigos[np.r_[0, cortes]]], np.split(posiciones, cortes)))
+        print(f"🔤 Índice de estudiantes: {len(self.normalizados)} nombres, {len(self.trigramas)} trigramas")
+
+    @staticmethod
+    def _trigramas_de(texto):
+        return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+    def search_exact(self, consulta, permitidas=None):
+        """Posiciones cuyo nombre contiene la consulta (sin distinguir tildes ni mayúsculas)"""
+        consulta = normalize_key(consulta)
+        if not consulta:
+            return np.array([], dtype=np.int64)
+        trigramas = self._trigramas_de(consulta)
+        if trigramas:
+            listas = sorted((self.trigramas.get(t, np.array([], dtype=np.int64)) for t in trigramas), key=len)
+            candidatas = listas[0]
+            for lista in listas[1:]:
+                if not len(candidatas):
+                    break
+                candidatas = np.intersect1d(candidatas, lista, assume_unique=True)
+        else:
+            candidatas = np.arange(len(self.normalizados))
+        if permitidas is not None:
+            candidatas = np.intersect1d(candidatas, permitidas)
+        return np.array([i for i in candidatas if consulta in self.normalizados[i]], dtype=np.int64)
+
+    def search_fuzzy(self, consulta, limite=5, permitidas=None):
+        """Posiciones de los nombres más parecidos, puntuando solo un conjunto pequeño de candidatos"""
+        consulta = normalize_key(consulta)
+        listas = [self.trigramas[t] for t in self._trigramas_de(consulta) if t in self.trigramas]
+        if not listas:
+            return np.array([], dtype=np.int64)
+        candidatas, comunes = np.unique(np.concatenate(listas), return_counts=True)
+        if permitidas is not None:
+            mascara = np.isin(candidatas, permitidas)
+            candidatas, comunes = candidatas[mascara], comunes[mascara]
+        if len(candidatas) > self.MAX_CANDIDATOS:
+            mejores = np.argpartition(-comunes, self.MAX_CANDIDATOS)[:self.MAX_CANDIDATOS]
+            candidatas = candidatas[mejores]
+        
+        nombres = list(dict.fromkeys(self.normalizados[i] for i in candidatas))
+        coincidencias = [nombre for nombre, puntaje in process.extract(consulta, nombres, limit=limite)
+                         if puntaje > self.UMBRAL_DIFUSO]
+        if not coincidencias:
+            return np.array([], dtype=np.int64)
+        posiciones = np.sort(np.concatenate([self.posiciones_por_nombre[nombre] for nombre in coincidencias]))
+        return posiciones if permitidas is None else np.intersect1d(posiciones, permitidas)
+
+    def search(self, consulta, permitidas=None):
+        """Búsqueda exacta y, si no hay resultados, difusa"""
+        posiciones = self.search_exact(consulta, permitidas)
+        if len(posiciones):
+            return posiciones
+        return self.search_fuzzy(consulta, permitidas=permitidas)
+
+
+class StudentView:
+    """Tabla de estudiantes con coordenadas, materializada una vez por carga de datos.
+
+    Mantiene índices hash por cédula normalizada y por período; las consultas
+    devuelven posiciones y solo se toman las filas que se van a mostrar.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.periodos = PeriodPartition(df, 'Período_Convertido') if 'Período_Convertido' in df.columns else None
+        if 'Cédula' in df.columns:
+            cedulas = normalize_id(df['Cédula'])
+            self.cedulas = cedulas.groupby(cedulas, sort=False).indices
+            self.cedulas.pop('', None)
+        else:
+            self.cedulas = {}
+
+    def in_period(self, periodo):
+        """Posiciones de las filas del período (None si la tabla no tiene período)"""
+        if self.periodos is None:
+            return None
+        return self.periodos.posiciones.get(periodo, np.array([], dtype=np.int64))
+
+    def by_id(self, cedula, permitidas=None):
+        """Posiciones de las filas con esa cédula (en cualquier formato de escritura)"""
+        clave = normalize_id(pd.Series([cedula])).iloc[0]
+        posiciones = self.cedulas.get(clave, np.array([], dtype=np.int64))
+        return posiciones if permitidas is None else np.intersect1d(posiciones, permitidas)
+
+    def rows(self, posiciones):
+        return self.df.iloc[posiciones]
+
+
+# Columna de período de cada fuente
+COLUMNAS_PERIODO = {
+    'datos': 'Período_Convertido',
+    'beneficiarios': 'Período de registro',
+    'encuesta': 'Periodo',
+}
+
+COLUMNA_CENTRO = 'Centro de Educación'
+COLUMNA_CATEGORIA = 'Qué voy a reportar'
+
+# Métricas del reporte consolidado. 'conteo' cuenta los registros de la categoría
+# por centro; 'suma' suma la columna cuyo nombre contiene todas las palabras clave
+# en los registros de la categoría. Agregar una métrica no agrega otra pasada.
+METRICAS_CONSOLIDADO = [
+    {'nombre': 'Atenciones Individuales', 'tipo': 'conteo',
+     'categoria': 'Estudiante atendido Individualmente'},
+    {'nombre': 'Asesorías', 'tipo': 'conteo',
+     'categoria': 'Asesorías a funcionarios'},
+    {'nombre': 'Evaluaciones Psicopedagógicas', 'tipo': 'conteo',
+     'categoria': 'Beneficiarios de evaluación psicopedagógica'},
+    {'nombre': 'DIAC', 'tipo': 'conteo',
+     'categoria': 'Beneficiarios DIAC o plan de intervención'},
+    {'nombre': 'Capacitaciones Funcionarios', 'tipo': 'conteo',
+     'categoria': 'Capacitación a funcionario(s) (Docentes u otros)'},
+    {'nombre': 'Sensibilizaciones', 'tipo': 'conteo',
+     'categoria': 'Sensibilización'},
+    {'nombre': 'Capacitaciones Padres', 'tipo': 'conteo',
+     'categoria': 'Capacitación a padres de familia'},
+    {'nombre': 'Personas Sensibilizadas', 'tipo': 'suma',
+     'categoria': 'Sensibilización', 'columna': ('participantes', 'sensibilización')},
+    {'nombre': 'Padres y Cuidadores Capacitados', 'tipo': 'suma',
+     'categoria': 'Capacitación a padres de familia', 'columna': ('padres', 'capacitación', 'número')},
+]
+
+# Columnas de cada hoja del reporte consolidado, en orden
+HOJAS_CONSOLIDADO = {
+    'Beneficiarios': ['Atenciones Individuales', 'Asesorías', 'Personas Sensibilizadas',
+                      'Padres y Cuidadores Capacitados', 'Evaluaciones Psicopedagógicas', 'DIAC'],
+    'Actividades': ['Capacitaciones Funcionarios', 'Sensibilizaciones', 'Capacitaciones Padres'],
+}
+
+
+def find_column(columnas, palabras):
+    """Primera columna cuyo nombre (en minúsculas) contiene todas las palabras"""
+    for col in columnas:
+        if all(palabra in str(col).lower() for palabra in palabras):
+            return col
+    return None
+
+
+def compute_metrics(df, claves=(COLUMNA_CENTRO,), metricas=METRICAS_CONSOLIDADO):
+    """Calcula todas las métricas por grupo con una sola agrupación.
+
+    Devuelve un DataFrame indexado por ``claves`` con una columna entera por métrica.
+    """
+    claves = list(claves)
+    columnas_suma = {}
+    for metrica in metricas:
+        if metrica['tipo'] == 'suma':
+            col = find_column(df.columns, metrica['columna'])
+            if col:
+                print(f"Usando columna para '{metrica['nombre']}': '{col}'")
+            else:
+                print(f"⚠️ No se encontró columna para '{metrica['nombre']}', usando 0")
+            columnas_suma[metrica['nombre']] = col
+    sumandos = sorted({col for col in columnas_suma.values() if col})
+    
+    tabla = df[claves + [COLUMNA_CATEGORIA]].copy()
+    for col in sumandos:
+        tabla[col] = pd.to_numeric(df[col], errors='coerce')
+    
+    grupos = tabla.groupby(claves + [COLUMNA_CATEGORIA], sort=False)
+    conteos = grupos.size().unstack(COLUMNA_CATEGORIA, fill_value=0)
+    sumas = grupos[sumandos].sum().unstack(COLUMNA_CATEGORIA, fill_value=0) if sumandos else None
+    
+    resultado = pd.DataFrame(index=conteos.index)
+    for metrica in metricas:
+        categoria = metrica['categoria']
+        valores = 0
+        if metrica['tipo'] == 'conteo':
+            if categoria in conteos.columns:
+                valores = conteos[categoria]
+            total = int(valores.sum()) if categoria in conteos.columns else 0
+            print(f"Categoría '{metrica['nombre']}' con filtro '{categoria}': {total} registros")
+        else:
+            col = columnas_suma[metrica['nombre']]
+            if col and (col, categoria) in sumas.columns:
+                valores = sumas[(col, categoria)]
+        resultado[metrica['nombre']] = valores
+    return resultado.fillna(0).astype(int)
+
+
+def build_consolidated_sheets(df_beneficiarios_filtrado, metricas=None):
+    """Arma las hojas Beneficiarios y Actividades de un período.
+
+    ``metricas`` permite pasar el resultado ya calculado de ``compute_metrics``
+    (por ejemplo, una porción de un cálculo de varios períodos).
+    """
+    centros = pd.DataFrame({COLUMNA_CENTRO: df_beneficiarios_filtrado[COLUMNA_CENTRO].unique()})
+    if metricas is None:
+        metricas = compute_metrics(df_beneficiarios_filtrado)
+    valores = metricas.reindex(centros[COLUMNA_CENTRO]).fillna(0).astype(int)
+    
+    hojas = {}
+    for hoja, columnas in HOJAS_CONSOLIDADO.items():
+        tabla = centros.copy()
+        for col in columnas:
+            tabla[col] = valores[col].to_numpy()
+        hojas[hoja] = tabla
+    return hojas
+
+
+# Motores para los libros de Excel y formatos adicionales por hoja
+MOTORES_EXCEL = ('openpyxl', 'streaming')
+FORMATOS_ADICIONALES = ('ninguno', 'csv', 'parquet')
+
+# Perfiles de renderizado del análisis de beneficiarios: el borrador sirve para revisar
+# rápidamente un período (baja resolución, sin nubes de palabras); impresión es la versión final
+PERFILES_RENDER = {
+    'impresion': {'dpi': 300, 'nubes': True, 'vectoriales': ('svg', 'pdf'), 'sufijo': ''},
+    'borrador': {'dpi': 72, 'nubes': False, 'vectoriales': (), 'sufijo': '_borrador'},
+}
+
+
+def _write_xlsx_streaming(hojas, archivo):
+    """Escribe el libro fila por fila con xlsxwriter en modo de memoria constante"""
+    libro = xlsxwriter.Workbook(archivo, {
+        'constant_memory': True,
+        'strings_to_urls': False,
+        'remove_timezone': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+    })
+    # Mismo estilo de encabezado que usa pandas
+    formato_encabezado = libro.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    try:
+        for nombre_hoja, tabla in hojas.items():
+            hoja = libro.add_worksheet(nombre_hoja)
+            hoja.write_row(0, 0, [str(col) for col in tabla.columns], formato_encabezado)
+            valores = tabla.astype(object).where(tabla.notna(), None)
+            for fila, registro in enumerate(valores.itertuples(index=False, name=None), start=1):
+                hoja.write_row(fila, 0, registro)
+    finally:
+        libro.close()
+
+
+def write_sheets(hojas, archivo, motor='openpyxl', adicional='ninguno'):
+    """Escribe un libro de Excel con las hojas indicadas y, si se pide, un CSV/Parquet por hoja.
+
+    Devuelve la lista de archivos generados.
+    """
+    if motor == 'streaming' and xlsxwriter is not None:
+        _write_xlsx_streaming(hojas, archivo)
+    else:
+        with pd.ExcelWriter(archivo, engine='openpyxl') as writer:
+            for nombre_hoja, tabla in hojas.items():
+                tabla.to_excel(writer, sheet_name=nombre_hoja, index=False)
+    archivos = [archivo]
+    
+    if adicional == 'parquet' and pa is None:
+        print("⚠️ pyarrow no está instalado, no se generan archivos Parquet")
+    elif adicional in ('csv', 'parquet'):
+        base = os.path.splitext(archivo)[0]
+        for nombre_hoja, tabla in hojas.items():
+            ruta = f"{base}_{nombre_hoja}.{adicional}"
+            if adicional == 'csv':
+                tabla.to_csv(ruta, index=False, encoding='utf-8-sig')
+            else:
+                SnapshotStore.compatible_con_arrow(tabla.copy()).to_parquet(ruta, index=False)
+            archivos.append(ruta)
+    return archivos
+
+
+# Palabras que no aportan a las nubes de palabras de la encuesta
+STOP_WORDS_ES = {
+    'el', 'la', 'los', 'las', 'un', 'una', 'de', 'del', 'a', 'al', 'que', 'en', 'por', 'para',
+    'con', 'sin', 'sobre', 'y', 'o', 'pero', 'también', 'ni', 'como', 'muy', 'no', 'ha', 'su',
+    'estudiante', 'estudiantes', 'niño', 'niña', 'niños', 'niñas', 'actividad', 'actividades'
+}
+
+
+# Barras por gráfico de ciudades o instituciones: el resto va a "Otros" o a otras páginas
+MAX_BARRAS_GRAFICO = 20
+
+
+def top_n_counts(conteos, n=MAX_BARRAS_GRAFICO, etiqueta_otros='Otros'):
+    """Los ``n`` mayores conteos (ya ordenados) y la suma del resto en una barra ``Otros``"""
+    if len(conteos) <= n:
+        return conteos
+    return pd.concat([conteos.iloc[:n], pd.Series({etiqueta_otros: conteos.iloc[n:].sum()})]).rename(conteos.name)
+
+
+def ranking_table(conteos, etiqueta):
+    """Ranking completo de respuestas para exportar junto a los gráficos"""
+    return pd.DataFrame({
+        'Posición': np.arange(1, len(conteos) + 1),
+        etiqueta: conteos.index,
+        'Respuestas': conteos.to_numpy(),
+        'Porcentaje': (conteos / conteos.sum() * 100).round(1).to_numpy(),
+    })
+
+
+# Funciones de renderizado a nivel de módulo para poder ejecutarlas en otros procesos;
+# cada una recibe solo los datos que dibuja
+def _figure_bytes(formato, dpi):
+    """Guarda la figura actual en memoria en el formato pedido y la cierra"""
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format=formato, dpi=dpi, bbox_inches='tight')
+    plt.close()
+    return buffer.getvalue()
+
+
+def render_city_chart(city_counts, formato='jpg', dpi=300, total=None):
+    """Gráfico de barras de respuestas por ciudad (``total``: base de los porcentajes)"""
+    total = total or city_counts.sum()
+    plt.style.use('default')
+    plt.figure(figsize=(10, 6))
+    city_counts.plot(kind='bar', color='skyblue')
+    plt.title('Distribución de Respuestas por Ciudad')
+    plt.xlabel('Ciudad')
+    plt.ylabel('Número de Respuestas')
+    plt.xticks(rotation=45, ha='right')
+    for index, value in enumerate(city_counts):
+        plt.text(index, value + 0.5, f'{value}\n({value / total * 100:.1f}%)', 
+                ha='center', va='bottom')
+    plt.tight_layout()
+    return _figure_bytes(formato, dpi)
+
+
+def render_institution_chart(institution_counts, formato='jpg', dpi=300, total=None):
+    """Gráfico de barras horizontales de respuestas por institución (``total``: base de los porcentajes)"""
+    total = total or institution_counts.sum()
+    plt.style.use('default')
+    plt.figure(figsize=(12, 8))
+    institution_counts.plot(kind='barh', color='lightgreen')
+    plt.title('Distribución de Respuestas por Institución')
+    plt.xlabel('Número de Respuestas')
+    plt.ylabel('Institución')
+    for index, value in enumerate(institution_counts):
+        plt.text(value + 0.5, index, f'{value}\n({value / total * 100:.1f}%)', 
+                va='center')
+    plt.tight_layout()
+    return _figure_bytes(formato, dpi)
+
+
+def render_wordcloud(frecuencias, formato='png', width=800, height=400):
+    """Nube de palabras a partir de las frecuencias ya calculadas de los términos"""
+    # Semilla fija: la misma distribución en el PNG y en el SVG
+    wordcloud = WordCloud(width=width, height=height, background_color='white',
+                          random_state=0).generate_from_frequencies(frecuencias)
+    if formato == 'svg':
+        return wordcloud.to_svg().encode('utf-8')
+    buffer = io.BytesIO()
+    wordcloud.to_image().save(buffer, format=formato.upper())
+    return buffer.getvalue()
+
+
+def _timed_render(funcion, datos, formato, estilo):
+    inicio = time.perf_counter()
+    resultado = funcion(datos, formato, **estilo)
+    return resultado, time.perf_counter() - inicio
+
+
+def render_charts(tareas, pool=None, al_terminar=None, cache=None):
+    """Ejecuta tareas de renderizado ``(nombre, función, datos, formato, estilo)`` en memoria.
+
+    Con ``cache`` las imágenes con los mismos datos y estilo se toman de la
+    caché en lugar de dibujarse; el resto se dibuja en paralelo si hay
+    ``pool``. Devuelve ``{nombre: (bytes, segundos)}`` en el orden de las tareas
+    y llama a ``al_terminar(nombre, segundos, desde_cache)`` al completarse cada una.
+    """
+    resultados = {}
+    pendientes = []
+    for tarea in tareas:
+        nombre, funcion, datos, formato, estilo = tarea
+        inicio = time.perf_counter()
+        contenido = cache.restore(cache.key(funcion, datos, estilo), formato) if cache is not None else None
+        if contenido is not None:
+            resultados[nombre] = (contenido, time.perf_counter() - inicio)
+            if al_terminar:
+                al_terminar(nombre, resultados[nombre][1], True)
+        else:
+            pendientes.append(tarea)
+    
+    def completar(tarea, resultado):
+        nombre, funcion, datos, formato, estilo = tarea
+        resultados[nombre] = resultado
+        if cache is not None:
+            cache.store(cache.key(funcion, datos, estilo), formato, resultado[0])
+        if al_terminar:
+            al_terminar(nombre, resultado[1], False)
+    
+    if pool is None or len(pendientes) < 2:
+        for tarea in pendientes:
+            completar(tarea, _timed_render(*tarea[1:]))
+    else:
+        futuros = {pool.submit(_timed_render, *tarea[1:]): tarea for tarea in pendientes}
+        try:
+            for futuro in as_completed(futuros):
+                completar(futuros[futuro], futuro.result())
+        finally:
+            for futuro in futuros:
+                futuro.cancel()
+    return {tarea[0]: resultados[tarea[0]] for tarea in tareas if tarea[0] in resultados}
+
+
+# Cambiar cuando cambie el contenido o el formato de los archivos generados
+REPORT_CODE_VERSION = '2.0.1'
+
+
+def fingerprint(*partes):
+    """Huella SHA-256 de un conjunto de tablas y valores"""
+    huella = hashlib.sha256()
+    for parte in partes:
+        if isinstance(parte, pd.Series):
+            # En los conteos las etiquetas están en el índice
+            huella.update(repr(parte.name).encode('utf-8'))
+            huella.update(pd.util.hash_pandas_object(parte, index=True).to_numpy().tobytes())
+        elif isinstance(parte, pd.DataFrame):
+            huella.update(repr(list(parte.columns)).encode('utf-8'))
+            huella.update(pd.util.hash_pandas_object(parte, index=False).to_numpy().tobytes())
+        else:
+            huella.update(repr(parte).encode('utf-8'))
+        huella.update(b'|')
+    return huella.hexdigest()
+
+
+def write_atomic(ruta, datos):
+    """Escribe ``datos`` (bytes, texto o una función que recibe la ruta temporal) en
+    un archivo temporal y lo mueve sobre ``ruta``: nunca queda un archivo a medias"""
+    temporal = f"{ruta}.tmp"
+    try:
+        if callable(datos):
+            datos(temporal)
+        else:
+            with open(temporal, 'wb') as f:
+                f.write(datos.encode('utf-8') if isinstance(datos, str) else datos)
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+def write_json(ruta, valor, **opciones):
+    write_atomic(ruta, json.dumps(valor, ensure_ascii=False, **opciones))
+
+
+def read_json(ruta):
+    """Contenido de un JSON guardado ({} si no existe o está dañado)"""
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class BuildCache:
+    """Manifiesto de los archivos generados y de las huellas de las entradas que los produjeron.
+
+    Si las entradas de un artefacto (filas de origen, período, versión del
+    código y opciones de salida) no cambiaron y sus archivos siguen intactos,
+    la acción devuelve los existentes sin recalcular.
+    """
+
+    def __init__(self, ruta_manifiesto):
+        self.ruta = ruta_manifiesto
+        self.manifiesto = read_json(self.ruta)
+
+    @staticmethod
+    def _estado(archivo):
+        info = os.stat(archivo)
+        return [info.st_size, int(info.st_mtime)]
+
+    def is_fresh(self, artefacto, huella):
+        """True si el artefacto ya se generó con esas entradas y sus archivos no cambiaron"""
+        entrada = self.manifiesto.get(os.path.abspath(artefacto))
+        if not entrada or entrada.get('huella') != huella:
+            return False
+        try:
+            return all(self._estado(archivo) == estado for archivo, estado in entrada['archivos'].items())
+        except OSError:
+            return False
+
+    def record(self, artefacto, huella, archivos, **entradas):
+        """Registra qué huella produjo qué archivos"""
+        self.manifiesto[os.path.abspath(artefacto)] = {
+            'huella': huella,
+            'version': REPORT_CODE_VERSION,
+            'generado': datetime.now().isoformat(timespec='seconds'),
+            'entradas': entradas,
+            'archivos': {os.path.abspath(archivo): self._estado(archivo) for archivo in archivos},
+        }
+        write_json(self.ruta, self.manifiesto, indent=2)
+
+
+class InstitutionAliasTable:
+    """Tabla persistente institución → centro de educación usada para emparejar los oficios.
+
+    Los nombres se comparan normalizados y solo se puntúan los que no tienen
+    una coincidencia vigente; lo aceptado se reutiliza entre períodos. Una
+    coincidencia fijada por un revisor (incluida "sin coincidencia") nunca se
+    vuelve a calcular.
+    """
+
+    UMBRAL = 60
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        guardado = read_json(self.ruta)
+        # Clave de institución -> {'institucion', 'centro' (clave), 'puntaje', 'fijado', 'candidatos'}
+        self.alias = guardado.get('alias', {})
+        # Clave de centro -> último nombre visto en un reporte consolidado
+        self.centros = guardado.get('centros', {})
+
+    def _guardar(self):
+        write_json(self.ruta, {'alias': self.alias, 'centros': self.centros}, indent=2)
+
+    def _vigente(self, clave, entrada, candidatos, huella):
+        if entrada is None:
+            return False
+        if entrada['fijado']:
+            return True
+        # Un centro con el mismo nombre normalizado siempre gana a una coincidencia aproximada
+        if clave in candidatos and entrada['centro'] != clave:
+            return False
+        # Una coincidencia aceptada sirve mientras el centro siga en el reporte;
+        # una dudosa solo si los candidatos son los mismos con los que se puntuó
+        return entrada['centro'] in candidatos and (entrada['puntaje'] > self.UMBRAL or entrada['candidatos'] == huella)
+
+    def match_all(self, instituciones, centros):
+        """Empareja cada institución con un centro del reporte.
+
+        Devuelve ``{institución: (centro, puntaje, aceptada)}`` donde ``centro`` es
+        el nombre tal como aparece en ``centros`` (o None).
+        """
+        instituciones = pd.Series(pd.unique(pd.Series(instituciones).dropna()), dtype=object)
+        centros = pd.Series(pd.unique(pd.Series(centros).dropna()), dtype=object)
+        claves_centros = normalize_text(centros)
+        candidatos = dict(zip(claves_centros, centros))
+        candidatos.pop('', None)
+        huella = fingerprint(sorted(candidatos))
+        lista_candidatos = list(candidatos)
+        
+        nuevas = 0
+        for institucion, clave in zip(instituciones, normalize_text(instituciones)):
+            entrada = self.alias.get(clave)
+            if self._vigente(clave, entrada, candidatos, huella):
+                continue
+            if clave in candidatos:
+                centro, puntaje = clave, 100
+            else:
+                centro, puntaje = process.extractOne(clave, lista_candidatos) if lista_candidatos else ('', 0)
+            self.alias[clave] = {'institucion': institucion, 'centro': centro, 'puntaje': int(puntaje),
+                                 'fijado': False, 'candidatos': huella}
+            nuevas += 1
+        
+        self.centros.update(candidatos)
+        self._guardar()
+        print(f"🔗 Coincidencias de instituciones: {len(instituciones)} ({nuevas} calculadas, {len(instituciones) - nuevas} reutilizadas)")
+        
+        resultado = {}
+        for institucion, clave in zip(instituciones, normalize_text(instituciones)):
+            entrada = self.alias[clave]
+            centro = candidatos.get(entrada['centro'])
+            aceptada = centro is not None and (entrada['fijado'] or entrada['puntaje'] > self.UMBRAL)
+            resultado[institucion] = (centro, entrada['puntaje'], aceptada)
+        return resultado
+
+    def pin(self, institucion, centro=None):
+        """Fija la coincidencia de una institución (``centro=None``: sin coincidencia)"""
+        clave = normalize_key(institucion)
+        self.alias[clave] = {'institucion': institucion, 'centro': normalize_key(centro) if centro else '',
+                             'puntaje': 100 if centro else 0, 'fijado': True, 'candidatos': None}
+        if centro:
+            self.centros.setdefault(normalize_key(centro), centro)
+        self._guardar()
+
+    def unpin(self, institucion):
+        """Quita la fijación; la institución se vuelve a puntuar en la próxima generación"""
+        self.alias.pop(normalize_key(institucion), None)
+        self._guardar()
+
+
+class RenderCache:
+    """Imágenes ya dibujadas, indexadas por la huella de sus datos de entrada y su estilo.
+
+    Si un gráfico recibe exactamente los mismos datos (p. ej. los mismos
+    conteos por ciudad) se reutiliza la imagen guardada en lugar de volver a
+    dibujarla. Al superar ``limite_bytes`` se eliminan las menos usadas.
+    """
+
+    def __init__(self, directorio, limite_bytes=200 * 1024 * 1024):
+        self.directorio = directorio
+        self.limite_bytes = limite_bytes
+        os.makedirs(self.directorio, exist_ok=True)
+
+    @staticmethod
+    def key(funcion, datos, estilo):
+        # Los conjuntos (stopwords) se ordenan para que la huella no dependa del orden de iteración
+        estilo = {clave: sorted(valor) if isinstance(valor, (set, frozenset)) else valor
+                  for clave, valor in sorted(estilo.items())}
+        return fingerprint(funcion.__name__, datos, estilo, REPORT_CODE_VERSION)
+
+    def _ruta(self, clave, formato):
+        return os.path.join(self.directorio, f"{clave}.{formato}")
+
+    def restore(self, clave, formato):
+        """Contenido de la imagen guardada (None si no está en caché)"""
+        ruta = self._ruta(clave, formato)
+        try:
+            with open(ruta, 'rb') as f:
+                contenido = f.read()
+            os.utime(ruta)  # Marca de uso para el desalojo
+            return contenido
+        except OSError:
+            return None
+
+    def store(self, clave, formato, contenido):
+        ruta = self._ruta(clave, formato)
+        try:
+            write_atomic(ruta, contenido)
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar el gráfico en caché: {e}")
+            return
+        self._evict()
+
+    def _evict(self):
+        entradas = []
+        for entrada in os.scandir(self.directorio):
+            if entrada.is_file() and not entrada.name.endswith('.tmp'):
+                info = entrada.stat()
+                entradas.append((info.st_mtime, info.st_size, entrada.path))
+        total = sum(tamano for _, tamano, _ in entradas)
+        for _, tamano, ruta in sorted(entradas):
+            if total <= self.limite_bytes:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano
+            except OSError:
+                pass
+
+
+def tokenize_responses(textos, stopwords=STOP_WORDS_ES):
+    """Términos de cada respuesta: tabla larga ``(respuesta, termino, forma, frecuencia)``.
+
+    ``termino`` es la palabra sin tildes ni mayúsculas (agrupa "atención" y
+    "Atencion"); ``forma`` es la palabra tal como se escribió, en minúsculas.
+    La respuesta se identifica por la etiqueta de ``textos``.
+    """
+    formas = textos.astype(str).str.lower().str.findall(r"[^\W\d_]{2,}").explode().dropna()
+    terminos = normalize_text(formas)
+    vacias = set(normalize_text(pd.Series(sorted(stopwords))))
+    tabla = pd.DataFrame({'respuesta': formas.index, 'termino': terminos.to_numpy(), 'forma': formas.to_numpy()})
+    tabla = tabla[~tabla['termino'].isin(vacias)]
+    return (tabla.groupby(['respuesta', 'termino', 'forma'], sort=False).size()
+            .rename('frecuencia').reset_index())
+
+
+class TermStore:
+    """Frecuencias de términos de las respuestas abiertas de la encuesta, por respuesta.
+
+    Cada respuesta se tokeniza una sola vez (se identifica por el hash de su
+    texto) y sus conteos quedan guardados en disco. La tabla de un período, o
+    de varios, es la suma de los conteos de sus respuestas.
+    """
+
+    VERSION = 1
+    TAMANO_LOTE = 5000
+
+    def __init__(self, ruta, stopwords=STOP_WORDS_ES):
+        self.ruta = ruta
+        self.stopwords = stopwords
+        columnas = ['respuesta', 'termino', 'forma', 'frecuencia']
+        guardado = read_json(self.ruta)
+        try:
+            if guardado.get('version') != self.VERSION or guardado.get('stopwords') != sorted(stopwords):
+                raise ValueError("tabla de términos de otra versión")
+            self.tabla = pd.DataFrame({columna: guardado[columna] for columna in columnas})
+        except (ValueError, KeyError):
+            guardado = {}
+            self.tabla = pd.DataFrame({columna: [] for columna in columnas})
+        self.tabla['frecuencia'] = self.tabla['frecuencia'].astype('int64')
+        self.procesadas = set(self.tabla['respuesta'])
+        # Respuestas sin ningún término útil (para no volver a tokenizarlas)
+        self.sin_terminos = set(guardado.get('sin_terminos', []))
+
+    @staticmethod
+    def response_ids(textos):
+        """Identificador estable de cada respuesta a partir de su texto"""
+        hashes = pd.util.hash_pandas_object(textos.astype(str), index=False).to_numpy()
+        return pd.Series([format(h, '016x') for h in hashes], index=textos.index, dtype=object)
+
+    def _guardar(self):
+        datos = {columna: self.tabla[columna].tolist() for columna in self.tabla.columns}
+        datos.update(version=self.VERSION, stopwords=sorted(self.stopwords), sin_terminos=sorted(self.sin_terminos))
+        write_json(self.ruta, datos)
+
+    def frequencies(self, textos):
+        """Frecuencia de cada término en un conjunto de respuestas, de mayor a menor.
+
+        Devuelve una tabla ``(termino, forma, frecuencia)`` donde ``forma`` es la
+        escritura más usada del término.
+        """
+        textos = textos.dropna()
+        textos = textos[textos.astype(str).str.strip() != '']
+        ids = self.response_ids(textos)
+        
+        # Solo se tokenizan las respuestas nunca vistas, por lotes
+        nuevas = textos.set_axis(ids.to_numpy())
+        nuevas = nuevas[~nuevas.index.isin(self.procesadas | self.sin_terminos)]
+        nuevas = nuevas[~nuevas.index.duplicated()]
+        if len(nuevas):
+            lotes = [tokenize_responses(nuevas.iloc[inicio:inicio + self.TAMANO_LOTE], self.stopwords)
+                     for inicio in range(0, len(nuevas), self.TAMANO_LOTE)]
+            agregadas = pd.concat(lotes, ignore_index=True)
+            self.tabla = pd.concat([self.tabla, agregadas], ignore_index=True)
+            self.procesadas.update(agregadas['respuesta'])
+            self.sin_terminos.update(set(nuevas.index) - self.procesadas)
+            self._guardar()
+            print(f"🔤 Términos: {len(nuevas)} respuestas nuevas tokenizadas de {len(textos)}")
+        
+        # Una respuesta repetida cuenta tantas veces como aparece
+        veces = ids.value_counts()
+        filas = self.tabla[self.tabla['respuesta'].isin(veces.index)]
+        conteos = filas.assign(frecuencia=filas['frecuencia'] * filas['respuesta'].map(veces).to_numpy())
+        por_forma = conteos.groupby(['termino', 'forma'], sort=False)['frecuencia'].sum().reset_index()
+        formas = (por_forma.sort_values(['frecuencia', 'forma'], ascending=[False, True])
+                  .drop_duplicates('termino').set_index('termino')['forma'])
+        total = por_forma.groupby('termino')['frecuencia'].sum()
+        resultado = pd.DataFrame({'termino': total.index, 'forma': formas.reindex(total.index).to_numpy(),
+                                  'frecuencia': total.to_numpy()})
+        return resultado.sort_values(['frecuencia', 'termino'], ascending=[False, True], ignore_index=True)
+
+
+class OficioTemplate:
+    """Plantilla de oficio compilada una sola vez.
+
+    Al compilar, cada ``[marcador]`` repartido entre varios runs (Word suele
+    partirlos al editar) se junta en el primero de ellos, sin tocar el formato
+    del resto del párrafo, y se registra en qué nodo de texto quedó. Cada
+    oficio se obtiene abriendo una copia desde los bytes compilados y
+    rellenando esos nodos en una sola pasada.
+    """
+
+    MARCADOR = re.compile(r'\[[^\[\]]+\]')
+    PARTES = re.compile(r'^/word/(document|header\d*|footer\d*)\.xml$')
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        doc = Document(ruta)
+        # partname -> [(posición del nodo w:t en la parte, marcadores que contiene)]
+        self.huecos = {}
+        for parte in self._partes(doc):
+            for p in parte.element.iter(qn('w:p')):
+                self._unir_marcadores(Paragraph(p, None))
+            huecos = []
+            for posicion, nodo in enumerate(parte.element.iter(qn('w:t'))):
+                marcadores = self.MARCADOR.findall(nodo.text or '')
+                if marcadores:
+                    huecos.append((posicion, marcadores))
+            if huecos:
+                self.huecos[str(parte.partname)] = huecos
+        self.marcadores = {marcador for huecos in self.huecos.values()
+                           for _, marcadores in huecos for marcador in marcadores}
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        self.contenido = buffer.getvalue()
+
+    @classmethod
+    def _partes(cls, doc):
+        return [parte for parte in doc.part.package.iter_parts() if cls.PARTES.match(str(parte.partname))]
+
+    @classmethod
+    def _unir_marcadores(cls, parrafo):
+        runs = parrafo.runs
+        textos = [run.text for run in runs]
+        completo = ''.join(textos)
+        if '[' not in completo:
+            return
+        limites = np.cumsum([0] + [len(texto) for texto in textos])
+        # De atrás hacia adelante: unir un marcador no mueve a los anteriores
+        for marcador in reversed(list(cls.MARCADOR.finditer(completo))):
+            inicio = np.searchsorted(limites, marcador.start(), side='right') - 1
+            fin = np.searchsorted(limites, marcador.end() - 1, side='right') - 1
+            if inicio == fin:
+                continue
+            corte = marcador.end() - limites[fin]
+            textos[inicio] += ''.join(textos[inicio + 1:fin]) + textos[fin][:corte]
+            textos[inicio + 1:fin] = [''] * (fin - inicio - 1)
+            textos[fin] = textos[fin][corte:]
+        for run, texto in zip(runs, textos):
+            if run.text != texto:
+                run.text = texto
+
+    def render(self, valores):
+        """Documento nuevo con los marcadores reemplazados (los desconocidos se dejan tal cual)"""
+        doc = Document(io.BytesIO(self.contenido))
+        reemplazar = lambda m: valores.get(m.group(0), m.group(0))
+        for parte in self._partes(doc):
+            huecos = self.huecos.get(str(parte.partname))
+            if not huecos:
+                continue
+            nodos = list(parte.element.iter(qn('w:t')))
+            for posicion, _ in huecos:
+                nodo = nodos[posicion]
+                nodo.text = self.MARCADOR.sub(reemplazar, nodo.text)
+                nodo.set(qn('xml:space'), 'preserve')
+        return doc
+
+
+# Plantilla compilada de cada proceso de generación de oficios
+_plantilla_oficio = None
+
+
+def _init_oficio_worker(plantilla):
+    global _plantilla_oficio
+    _plantilla_oficio = plantilla
+
+
+def write_oficio(plantilla, reemplazos, ruta):
+    """Rellena la plantilla y guarda el oficio de forma atómica (nunca queda un .docx a medias)"""
+    write_atomic(ruta, plantilla.render(reemplazos).save)
+
+
+def _timed_oficio(reemplazos, ruta):
+    inicio = time.perf_counter()
+    try:
+        write_oficio(_plantilla_oficio, reemplazos, ruta)
+        error = None
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    return os.getpid(), time.perf_counter() - inicio, error
+
+
+def generate_oficios(tareas, plantilla, procesos=1, al_terminar=None):
+    """Genera los oficios ``(nombre, reemplazos, ruta)`` a partir de una plantilla compilada.
+
+    Con ``procesos`` > 1 se reparten en un grupo de procesos que recibe la
+    plantilla una sola vez. Llama a ``al_terminar(nombre, proceso, segundos, error)``
+    al completarse cada oficio y devuelve ``{nombre: (proceso, segundos, error)}``;
+    ``error`` es None si el oficio se guardó.
+    """
+    resultados = {}
+    
+    def completar(nombre, resultado):
+        resultados[nombre] = resultado
+        if al_terminar:
+            al_terminar(nombre, *resultado)
+    
+    if procesos < 2 or len(tareas) < 2:
+        _init_oficio_worker(plantilla)
+        for nombre, reemplazos, ruta in tareas:
+            completar(nombre, _timed_oficio(reemplazos, ruta))
+        return resultados
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_init_oficio_worker,
+                             initargs=(plantilla,)) as pool:
+        futuros = {pool.submit(_timed_oficio, reemplazos, ruta): nombre for nombre, reemplazos, ruta in tareas}
+        try:
+            for futuro in as_completed(futuros):
+                completar(futuros[futuro], futuro.result())
+        finally:
+            for futuro in futuros:
+                futuro.cancel()
+    return resultados
+
+
+# Cambiar cuando cambie la forma de parsear o derivar columnas de las fuentes
+SNAPSHOT_VERSION = 1
+
+# Hojas de respuestas de Google Forms: solo se agregan filas al final
+FUENTES_INCREMENTALES = ('beneficiarios', 'encuesta')
+
+
+class SnapshotStore:
+    """Instantáneas columnares (Feather sin comprimir) de las fuentes ya parseadas.
+
+    Cada instantánea queda asociada al hash de los bytes de origen; si la hoja
+    cambia en Google Sheets el hash deja de coincidir y se vuelve a parsear.
+    Las lecturas posteriores mapean el archivo en memoria en lugar de abrir el
+    xlsx con openpyxl.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _rutas(self, clave):
+        return (os.path.join(self.directorio, f"{clave}.feather"),
+                os.path.join(self.directorio, f"{clave}.json"))
+
+    def _leer_meta(self, clave):
+        return read_json(self._rutas(clave)[1])
+
+    @staticmethod
+    def compatible_con_arrow(df):
+        """Convierte a texto las columnas con tipos mezclados que Arrow no puede representar"""
+        for col in df.columns:
+            if df[col].dtype != object:
+                continue
+            try:
+                pa.array(df[col], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+        return df
+
+    def load(self, clave, contenido, parser, incremental=False):
+        """Devuelve el DataFrame de la fuente, parseando ``contenido`` solo si cambió.
+
+        Con ``incremental`` (respuestas de formularios en CSV, que solo crecen)
+        se parsean únicamente las filas agregadas desde la última carga.
+        """
+        if feather is None:
+            return parser(contenido)
+        
+        sha = hashlib.sha256(contenido).hexdigest()
+        ruta = self._rutas(clave)[0]
+        meta = self._leer_meta(clave)
+        vigente = meta.get('version') == SNAPSHOT_VERSION and os.path.exists(ruta)
+        if vigente and meta.get('sha256') == sha:
+            try:
+                df = self._leer_tabla(ruta)
+                print(f"⚡ Instantánea '{clave}' reutilizada ({len(df)} filas)")
+                return df
+            except Exception as e:
+                print(f"⚠️ Instantánea '{clave}' ilegible, se vuelve a parsear: {e}")
+                vigente = False
+        
+        if vigente and incremental:
+            df = self._cargar_incremental(clave, contenido, meta)
+            if df is not None:
+                self._guardar(clave, df, sha, len(contenido))
+                return df
+        
+        df = self.compatible_con_arrow(parser(contenido))
+        self._guardar(clave, df, sha, len(contenido))
+        return df
+
+    def _leer_tabla(self, ruta):
+        return feather.read_table(ruta, memory_map=True).to_pandas()
+
+    def _cargar_incremental(self, clave, contenido, meta):
+        """Agrega a la instantánea solo las filas nuevas; None si hace falta una recarga completa"""
+        longitud = meta.get('bytes')
+        if not longitud or len(contenido) <= longitud:
+            return None
+        
+        # Si los bytes ya conocidos cambiaron, alguien editó respuestas existentes
+        if hashlib.sha256(memoryview(contenido)[:longitud]).hexdigest() != meta.get('sha256'):
+            print(f"✏️ Se detectaron ediciones en filas existentes de '{clave}', recarga completa")
+            return None
+        
+        # La exportación no termina en salto de línea: si los bytes nuevos no empiezan en una
+        # línea nueva, se completó o editó la última fila existente
+        frontera = contenido[longitud - 1:longitud + 1]
+        if b'\n' not in frontera and b'\r' not in frontera:
+            print(f"✏️ Se modificó la última fila de '{clave}', recarga completa")
+            return None
+        
+        try:
+            base = self._leer_tabla(self._rutas(clave)[0])
+            cola = contenido[longitud:].lstrip(b'\r\n')
+            if not cola.strip():
+                return base
+            # Las columnas de texto se leen como texto, igual que en una carga completa
+            # (p. ej. cédulas con cero inicial)
+            nuevas = pd.read_csv(io.BytesIO(cola), header=None, names=list(base.columns), index_col=False,
+                                 dtype={col: str for col in base.columns if base[col].dtype == object})
+        except Exception as e:
+            print(f"⚠️ No se pudieron agregar las filas nuevas de '{clave}', recarga completa: {e}")
+            return None
+        
+        # Sin convertir las filas nuevas al tipo de la instantánea: concat amplía el tipo
+        # (p. ej. enteros + 8.5 → float) igual que una carga completa, sin truncar valores
+        print(f"➕ '{clave}': {len(nuevas)} filas nuevas sobre {len(base)} existentes")
+        return self.compatible_con_arrow(pd.concat([base, nuevas], ignore_index=True))
+
+    def load_artifact(self, clave, nombre):
+        """Devuelve un dato derivado guardado con la instantánea vigente (None si no coincide)"""
+        meta = self._leer_meta(clave)
+        guardado = read_json(os.path.join(self.directorio, f"{clave}.{nombre}.json"))
+        if not meta or guardado.get('sha256') != meta.get('sha256'):
+            return None
+        return guardado.get('valor')
+
+    def save_artifact(self, clave, nombre, valor):
+        """Guarda un dato derivado asociado a la instantánea vigente de la fuente"""
+        meta = self._leer_meta(clave)
+        if not meta:
+            return
+        write_json(os.path.join(self.directorio, f"{clave}.{nombre}.json"), {'sha256': meta['sha256'], 'valor': valor})
+
+    def _guardar(self, clave, df, sha, longitud):
+        ruta, ruta_meta = self._rutas(clave)
+        try:
+            write_atomic(ruta, lambda temporal: feather.write_feather(df.reset_index(drop=True), temporal,
+                                                                      compression='uncompressed'))
+            write_json(ruta_meta, {'sha256': sha, 'bytes': longitud, 'version': SNAPSHOT_VERSION, 'filas': len(df)})
+            print(f"💾 Instantánea '{clave}' actualizada ({len(df)} filas)")
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar la instantánea '{clave}': {e}")
+
+
+class DataStore:
+    """Almacén de sesión con las tablas ya cargadas y normalizadas.
+
+    Las fuentes ('datos', 'beneficiarios', ...) y las tablas derivadas de ellas
+    se guardan una sola vez por sesión. Invalidar una fuente descarta también
+    todo lo que se construyó a partir de ella.
+    """
+
+    def __init__(self):
+        self._tablas = {}
+        self._dependencias = {}
+
+    def __contains__(self, clave):
+        return clave in self._tablas
+
+    def get(self, clave):
+        return self._tablas[clave]
+
+    def put(self, clave, valor, depende_de=()):
+        self._tablas[clave] = valor
+        self._dependencias[clave] = set(depende_de)
+
+    def get_or_build(self, clave, constructor, depende_de=()):
+        """Devuelve la tabla derivada, construyéndola solo la primera vez"""
+        if clave not in self._tablas:
+            self.put(clave, constructor(), depende_de)
+        return self._tablas[clave]
+
+    def invalidate(self, claves=None):
+        """Descarta las claves indicadas (o todas) y las tablas que dependen de ellas"""
+        if claves is None:
+            self._tablas.clear()
+            self._dependencias.clear()
+            return
+        pendientes = set(claves)
+        while pendientes:
+            clave = pendientes.pop()
+            self._tablas.pop(clave, None)
+            self._dependencias.pop(clave, None)
+            pendientes.update(k for k, deps in self._dependencias.items() if clave in deps)
+
+
+class SheetCache:
+    """Caché en disco de las exportaciones de Google Sheets.
+
+    Cada fuente se guarda como ``<clave>.bin`` junto a ``<clave>.json`` con los
+    metadatos de la descarga (URL, ETag, Last-Modified, hora y hash). Dentro del
+    TTL se devuelve el contenido local sin tocar la red; después se revalida con
+    una petición condicional, que cuesta un solo viaje cuando nada cambió.
+    """
+
+    def __init__(self, directorio, ttl_segundos=900, timeout=60):
+        self.directorio = directorio
+        self.ttl_segundos = ttl_segundos
+        self.timeout = timeout
+        # Una sola sesión con conexiones persistentes (keep-alive) compartida por todas las descargas
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount('https://', adaptador)
+        self.session.mount('http://', adaptador)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+        # Fuentes sensibles (p. ej. contraseñas) que solo se guardan en memoria
+        self._memoria = {}
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _rutas(self, clave):
+        return (os.path.join(self.directorio, f"{clave}.bin"),
+                os.path.join(self.directorio, f"{clave}.json"))
+
+    def _leer(self, clave, persistente):
+        """Devuelve (metadatos, contenido) guardados para la clave"""
+        if not persistente:
+            return self._memoria.get(clave, ({}, None))
+        ruta_contenido, ruta_meta = self._rutas(clave)
+        meta = read_json(ruta_meta)
+        if not meta:
+            return {}, None
+        try:
+            with open(ruta_contenido, 'rb') as f:
+                return meta, f.read()
+        except OSError:
+            return {}, None
+
+    def _guardar(self, clave, meta, contenido, persistente):
+        if not persistente:
+            if contenido is None:
+                contenido = self._memoria.get(clave, ({}, None))[1]
+            self._memoria[clave] = (meta, contenido)
+            return
+        ruta_contenido, ruta_meta = self._rutas(clave)
+        if contenido is not None:
+            write_atomic(ruta_contenido, contenido)
+        write_json(ruta_meta, meta, indent=2)
+
+    def get(self, clave, url, persistente=True, forzar=False):
+        """Devuelve (contenido, origen) donde origen es 'cache', 'revalidado' o 'descargado'"""
+        meta, contenido = self._leer(clave, persistente)
+        if meta.get('url') != url:
+            # La URL cambió: lo guardado no sirve ni para revalidar
+            meta, contenido = {}, None
+        
+        ahora = time.time()
+        if contenido is not None and not forzar and ahora - meta.get('descargado', 0) < self.ttl_segundos:
+            return contenido, 'cache'
+        
+        headers = {}
+        if contenido is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        
+        respuesta = self.session.get(url, headers=headers, timeout=self.timeout)
+        if respuesta.status_code == 304 and contenido is not None:
+            meta['descargado'] = ahora
+            self._guardar(clave, meta, None, persistente)
+            return contenido, 'revalidado'
+        respuesta.raise_for_status()
+        
+        contenido = respuesta.content
+        meta = {
+            'url': url,
+            'etag': respuesta.headers.get('ETag'),
+            'last_modified': respuesta.headers.get('Last-Modified'),
+            'descargado': ahora,
+            'bytes': len(contenido),
+            'sha256': hashlib.sha256(contenido).hexdigest(),
+        }
+        self._guardar(clave, meta, contenido, persistente)
+        return contenido, 'descargado'
+
+    def get_many(self, peticiones):
+        """Descarga varias fuentes a la vez sobre la sesión compartida.
+
+        ``peticiones`` es una lista de (clave, url, persistente). Devuelve
+        {clave: (contenido, origen, segundos)}; el tiempo total es
+        aproximadamente el de la descarga más lenta.
+        """
+        def tarea(peticion):
+            clave, url, persistente = peticion
+            inicio = time.perf_counter()
+            contenido, origen = self.get(clave, url, persistente=persistente)
+            return clave, (contenido, origen, time.perf_counter() - inicio)
+        
+        if not peticiones:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(peticiones)) as executor:
+            return dict(executor.map(tarea, peticiones))
+
+    def marcar_vencido(self, clave=None):
+        """Fuerza la revalidación de una fuente (o de todas) en la próxima lectura"""
+        claves = [clave] if clave else [
+            nombre[:-5] for nombre in os.listdir(self.directorio) if nombre.endswith('.json')
+        ] + list(self._memoria)
+        for c in claves:
+            persistente = c not in self._memoria
+            meta, _ = self._leer(c, persistente)
+            if meta:
+                meta['descargado'] = 0
+                self._guardar(c, meta, None, persistente)
+
+    def forget(self, clave):
+        """Descarta de la memoria una fuente sensible ya utilizada"""
+        self._memoria.pop(clave, None)
+
+
+class AuthSession:
+    """Sesión autenticada para las acciones protegidas.
+
+    La contraseña se descarga una vez y solo se conserva su hash PBKDF2 con una
+    sal aleatoria. Tras un ingreso correcto la sesión sigue abierta mientras no
+    pase más de ``inactividad_segundos`` entre dos usos.
+    """
+
+    ITERACIONES = 200_000
+
+    def __init__(self, inactividad_segundos=900):
+        self.inactividad_segundos = inactividad_segundos
+        self._sal = None
+        self._hash = None
+        self._ultimo_uso = None
+
+    def _derivar(self, texto):
+        return hashlib.pbkdf2_hmac('sha256', texto.encode('utf-8'), self._sal, self.ITERACIONES)
+
+    @property
+    def tiene_credencial(self):
+        return self._hash is not None
+
+    def set_credential(self, secreto):
+        self._sal = os.urandom(16)
+        self._hash = self._derivar(secreto)
+
+    def forget_credential(self):
+        """Obliga a descargar de nuevo la contraseña en el próximo ingreso"""
+        self._sal = self._hash = None
+
+    def login(self, intento):
+        """Compara el intento con el hash guardado y, si coincide, abre la sesión"""
+        if self._hash is None or not hmac.compare_digest(self._derivar(intento), self._hash):
+            return False
+        self._ultimo_uso = time.monotonic()
+        return True
+
+    def is_active(self):
+        return (self._ultimo_uso is not None and
+                time.monotonic() - self._ultimo_uso < self.inactividad_segundos)
+
+    def touch(self):
+        """Renueva la sesión si sigue activa; devuelve False si expiró"""
+        if not self.is_active():
+            self._ultimo_uso = None
+            return False
+        self._ultimo_uso = time.monotonic()
+        return True
+
+    def logout(self):
+        self._ultimo_uso = None
+
+
 class UnifiedReportApp:
+    # Lista de resultados de la consulta de estudiantes
+    FILAS_POR_PAGINA = 50
+    ESPERA_BUSQUEDA_MS = 250
+
     def __init__(self, root):
         self.root = root
         self.root.title("Sistema Unificado de Gestión de Reportes - Educación Especial")
-        self.root.geometry("600x500")
+        self.root.geometry("700x760")
         
         # Set default directory to Desktop
         self.directorio_destino = os.path.join(os.path.expanduser('~'), 'Desktop')
         
+        # Caché local de las hojas de cálculo (vigencia configurable en minutos)
+        self.directorio_cache = os.path.join(os.path.expanduser('~'), '.vinculab_cache')
+        self.ttl_cache_minutos = 15
+        self.sheet_cache = SheetCache(os.path.join(self.directorio_cache, 'exportaciones'),
+                                      ttl_segundos=self.ttl_cache_minutos * 60)
+        self.snapshot_store = SnapshotStore(os.path.join(self.directorio_cache, 'instantaneas'))
+        self.sincronizacion_incremental = True
+        
+        # Sesión de las acciones protegidas (minutos de inactividad antes de pedir la contraseña)
+        self.sesion_minutos = 15
+        self.sesion = AuthSession(inactividad_segundos=self.sesion_minutos * 60)
+        
+        # Formato de salida de los reportes (seleccionable en cada ejecución)
+        self.motor_excel = 'openpyxl'
+        self.formato_adicional = 'ninguno'
+        self.perfil_render = 'impresion'
+        self.paginar_graficos = False
+        self.exportar_imagenes = True
+        
+        # Tablas cargadas durante la sesión, compartidas por todas las acciones
+        self.data_store = DataStore()
+        
+        # Reportes ya generados y las entradas que los produjeron
+        self.build_cache = BuildCache(os.path.join(self.directorio_cache, 'manifiesto_reportes.json'))
+        self.alias_instituciones = InstitutionAliasTable(os.path.join(self.directorio_cache, 'alias_instituciones.json'))
+        self.render_cache = RenderCache(os.path.join(self.directorio_cache, 'graficos'))
+        self.term_store = TermStore(os.path.join(self.directorio_cache, 'terminos_encuesta.json'))
+        # Plantilla de oficio compilada (se compila al primer uso)
+        self.plantilla_oficio = None
+        
+        # Las acciones largas se ejecutan en un hilo de trabajo
+        self.jobs = JobRunner(self.root)
+        # Procesos para dibujar gráficos en paralelo (se crean al primer uso)
+        self.render_pool = None
+        
         # URLs de datos
         self.url_datos = "https://docs.google.com/spreadsheets/d/1p42nIbj66UIn-kyZQ1Ilbx13nxiWKIfEMbcrYMFae84/export?format=xlsx"
         self.url_beneficiarios = "https://docs.google.com/spreadsheets/d/15BR53PUapEaKiz2LYHK8l46R7HNYrRHhdwXREIv9Woo/export?format=csv"
@@ -55,6 +1661,38 @@ class UnifiedReportApp:
                                    fg="blue", wraplength=500)
         self.folder_label.pack()
         
+        # Cache Options
+        cache_frame = tk.Frame(self.root)
+        cache_frame.pack(pady=5)
+        tk.Label(cache_frame, text="Vigencia de caché (min):").pack(side=tk.LEFT)
+        self.ttl_var = tk.IntVar(value=self.ttl_cache_minutos)
+        tk.Spinbox(cache_frame, from_=0, to=1440, width=5, textvariable=self.ttl_var).pack(side=tk.LEFT, padx=5)
+        self.ttl_var.trace_add('write', lambda *args: self.update_cache_ttl())
+        tk.Button(cache_frame, text="Actualizar datos ahora", command=self.refresh_data).pack(side=tk.LEFT, padx=5)
+        self.incremental_var = tk.BooleanVar(value=self.sincronizacion_incremental)
+        self.incremental_var.trace_add('write', lambda *args: setattr(
+            self, 'sincronizacion_incremental', self.incremental_var.get()))
+        tk.Checkbutton(cache_frame, text="Sincronización incremental", variable=self.incremental_var).pack(side=tk.LEFT)
+        
+        # Output Options
+        output_frame = tk.Frame(self.root)
+        output_frame.pack(pady=5)
+        tk.Label(output_frame, text="Excel:").pack(side=tk.LEFT)
+        self.motor_var = tk.StringVar(value=self.motor_excel)
+        ttk.Combobox(output_frame, textvariable=self.motor_var, values=MOTORES_EXCEL,
+                     state='readonly', width=10).pack(side=tk.LEFT, padx=5)
+        self.motor_var.trace_add('write', lambda *args: setattr(self, 'motor_excel', self.motor_var.get()))
+        tk.Label(output_frame, text="Archivos adicionales por hoja:").pack(side=tk.LEFT)
+        self.adicional_var = tk.StringVar(value=self.formato_adicional)
+        ttk.Combobox(output_frame, textvariable=self.adicional_var, values=FORMATOS_ADICIONALES,
+                     state='readonly', width=8).pack(side=tk.LEFT, padx=5)
+        self.adicional_var.trace_add('write', lambda *args: setattr(self, 'formato_adicional', self.adicional_var.get()))
+        tk.Label(output_frame, text="Gráficos:").pack(side=tk.LEFT)
+        self.perfil_var = tk.StringVar(value=self.perfil_render)
+        ttk.Combobox(output_frame, textvariable=self.perfil_var, values=tuple(PERFILES_RENDER),
+                     state='readonly', width=9).pack(side=tk.LEFT, padx=5)
+        self.perfil_var.trace_add('write', lambda *args: setattr(self, 'perfil_render', self.perfil_var.get()))
+        
         # Main Functions Frame
         main_frame = tk.Frame(self.root)
         main_frame.pack(pady=20, expand=True, fill='both')
@@ -64,32 +1702,59 @@ class UnifiedReportApp:
         report_frame.pack(fill='x', pady=5)
         
         tk.Button(report_frame, text="Generar Reporte Unificado Consolidado", 
-                 command=self.generate_unified_consolidated_report, bg="lightblue", font=("Arial", 10, "bold")).pack(pady=2, fill='x')
+                 command=lambda: self.run_job("Reporte consolidado", self.generate_unified_consolidated_report), bg="lightblue", font=("Arial", 10, "bold")).pack(pady=2, fill='x')
+        tk.Button(report_frame, text="Generar Reportes por Lote (rango de períodos)", 
+                 command=lambda: self.run_job("Reportes por lote", self.generate_batch_consolidated_reports), bg="lightblue").pack(pady=2, fill='x')
         
         # Student Consultation Section
         student_frame = tk.LabelFrame(main_frame, text="Consulta de Estudiantes", padx=10, pady=10)
         student_frame.pack(fill='x', pady=5)
         
         tk.Button(student_frame, text="Consultar Estudiante", 
-                 command=self.start_student_consultation, bg="lightyellow").pack(pady=2, fill='x')
+                 command=lambda: self.run_job("Consulta de estudiantes", self.start_student_consultation), bg="lightyellow").pack(pady=2, fill='x')
+        session_frame = tk.Frame(student_frame)
+        session_frame.pack(pady=2)
+        tk.Label(session_frame, text="Cerrar sesión tras (min sin uso):").pack(side=tk.LEFT)
+        self.sesion_var = tk.IntVar(value=self.sesion_minutos)
+        tk.Spinbox(session_frame, from_=1, to=480, width=5, textvariable=self.sesion_var).pack(side=tk.LEFT, padx=5)
+        self.sesion_var.trace_add('write', lambda *args: self.update_session_timeout())
+        tk.Button(session_frame, text="Cerrar sesión", command=self.logout).pack(side=tk.LEFT, padx=5)
         
         # Impact Analysis Section
         impact_frame = tk.LabelFrame(main_frame, text="Análisis de Impacto", padx=10, pady=10)
         impact_frame.pack(fill='x', pady=5)
         
         tk.Button(impact_frame, text="Generar Análisis de Beneficiarios", 
-                 command=self.generate_beneficiary_analysis, bg="lightcoral").pack(pady=2, fill='x')
+                 command=lambda: self.run_job("Análisis de beneficiarios", self.generate_beneficiary_analysis), bg="lightcoral").pack(pady=2, fill='x')
+        self.paginar_var = tk.BooleanVar(value=self.paginar_graficos)
+        self.paginar_var.trace_add('write', lambda *args: setattr(self, 'paginar_graficos', self.paginar_var.get()))
+        tk.Checkbutton(impact_frame, text=f"Paginar ciudades e instituciones ({MAX_BARRAS_GRAFICO} por gráfico, sin \"Otros\")",
+                       variable=self.paginar_var).pack()
+        self.exportar_var = tk.BooleanVar(value=self.exportar_imagenes)
+        self.exportar_var.trace_add('write', lambda *args: setattr(self, 'exportar_imagenes', self.exportar_var.get()))
+        tk.Checkbutton(impact_frame, text="Exportar también las imágenes (además del documento Word)",
+                       variable=self.exportar_var).pack()
         
         # Document Generation Section
         doc_frame = tk.LabelFrame(main_frame, text="Generación de Oficios", padx=10, pady=10)
         doc_frame.pack(fill='x', pady=5)
         
         tk.Button(doc_frame, text="Generar Oficios Institucionales", 
-                 command=self.generate_official_documents, bg="lightpink").pack(pady=2, fill='x')
+                 command=lambda: self.run_job("Oficios institucionales", self.generate_official_documents), bg="lightpink").pack(pady=2, fill='x')
+        tk.Button(doc_frame, text="Revisar Coincidencias de Instituciones", 
+                 command=self.review_institution_matches, bg="lightpink").pack(pady=2, fill='x')
         
         # Status Label
         self.status_label = tk.Label(self.root, text="", fg="blue", wraplength=500)
-        self.status_label.pack(pady=10)
+        self.status_label.pack(pady=5)
+        
+        # Job progress
+        job_frame = tk.Frame(self.root)
+        job_frame.pack(pady=5)
+        self.job_label = tk.Label(job_frame, text="", fg="gray30", wraplength=420, justify=tk.LEFT)
+        self.job_label.pack(side=tk.LEFT)
+        self.cancel_button = tk.Button(job_frame, text="Cancelar", command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
 
     def select_folder(self):
         nuevo_directorio = filedialog.askdirectory(initialdir=self.directorio_destino)
@@ -97,9 +1762,181 @@ class UnifiedReportApp:
             self.directorio_destino = nuevo_directorio
             self.folder_label.config(text=f"Carpeta: {self.directorio_destino}")
 
+    def update_cache_ttl(self):
+        try:
+            self.ttl_cache_minutos = max(0, int(self.ttl_var.get()))
+        except (tk.TclError, ValueError):
+            return
+        self.sheet_cache.ttl_segundos = self.ttl_cache_minutos * 60
+
+    def update_session_timeout(self):
+        try:
+            self.sesion_minutos = max(1, int(self.sesion_var.get()))
+        except (tk.TclError, ValueError):
+            return
+        self.sesion.inactividad_segundos = self.sesion_minutos * 60
+
+    def logout(self):
+        self.sesion.logout()
+        self.update_status("Sesión cerrada: la próxima consulta pedirá la contraseña")
+
+    def refresh_data(self):
+        """Descarta las tablas de la sesión y marca las fuentes como vencidas para revalidarlas"""
+        # La tarea en curso usa las mismas tablas y la misma credencial
+        if self.jobs.ocupado:
+            messagebox.showwarning("Tarea en curso", f"Espere a que termine: {self.jobs.job.nombre}")
+            return
+        self.data_store.invalidate()
+        self.sheet_cache.marcar_vencido()
+        # La contraseña se vuelve a descargar en el próximo ingreso (la sesión abierta se mantiene)
+        self.sesion.forget_credential()
+        self.update_status("Los datos se revalidarán con Google Sheets en la próxima acción")
+
+    def fetch_source(self, clave):
+        """Obtiene el contenido de una fuente (datos, beneficiarios, ubicacion, encuesta, password) vía caché"""
+        return self.fetch_sources([clave])[clave]
+
+    def fetch_sources(self, claves):
+        """Descarga en paralelo todas las fuentes que necesita una acción y reporta los tiempos"""
+        # La hoja de contraseñas nunca se escribe en disco
+        peticiones = [(clave, getattr(self, f"url_{clave}"), clave != 'password') for clave in claves]
+        inicio = time.perf_counter()
+        resultados = self.sheet_cache.get_many(peticiones)
+        total = time.perf_counter() - inicio
+        
+        tiempos = []
+        for clave in claves:
+            contenido, origen, segundos = resultados[clave]
+            print(f"📥 Fuente '{clave}': {origen} ({len(contenido)} bytes, {segundos:.2f}s)")
+            tiempos.append(f"{clave} {segundos:.1f}s ({origen})")
+        self.update_status(f"Datos obtenidos en {total:.1f}s: " + ", ".join(tiempos))
+        return {clave: resultados[clave][0] for clave in claves}
+
+    def parse_source(self, clave, contenido):
+        """Parsea los bytes de una fuente y agrega las columnas derivadas"""
+        if clave in ('datos', 'ubicacion'):
+            df = pd.read_excel(io.BytesIO(contenido))
+        else:
+            df = pd.read_csv(io.BytesIO(contenido))
+        
+        if clave == 'datos' and 'Período' in df.columns:
+            # Convertir la columna Período a formato YYYY-Q
+            try:
+                df['Período_Convertido'] = convert_periods(df['Período'])
+            except (ValueError, TypeError):
+                # Formatos que la conversión vectorizada no admite: convertir fila por fila
+                df['Período_Convertido'] = df['Período'].apply(self.convert_timestamp_to_period)
+        elif clave == 'encuesta':
+            df.columns = df.columns.str.strip()
+        return df
+
+    def load_tables(self, claves):
+        """Descarga las fuentes y las devuelve como DataFrames, usando las instantáneas columnares"""
+        contenidos = self.fetch_sources(claves)
+        return {
+            clave: self.snapshot_store.load(
+                clave, contenidos[clave],
+                lambda contenido, clave=clave: self.parse_source(clave, contenido),
+                incremental=self.sincronizacion_incremental and clave in FUENTES_INCREMENTALES)
+            for clave in claves
+        }
+
+    def get_tables(self, claves):
+        """Devuelve las tablas de la sesión, cargando en un solo lote las que aún no están"""
+        faltantes = [clave for clave in claves if clave not in self.data_store]
+        if faltantes:
+            for clave, df in self.load_tables(faltantes).items():
+                self.data_store.put(clave, df)
+        else:
+            print(f"⚡ Tablas tomadas de la sesión: {', '.join(claves)}")
+        return {clave: self.data_store.get(clave) for clave in claves}
+
+    def get_partition(self, clave):
+        """Índice por período de una fuente de la sesión (se construye una vez por carga)"""
+        return self.data_store.get_or_build(
+            f"particion_{clave}",
+            lambda: PeriodPartition(self.data_store.get(clave), COLUMNAS_PERIODO[clave]),
+            depende_de=(clave,))
+
+    def get_location_index(self):
+        """Índice de ubicaciones por institución normalizada (persistido con la instantánea)"""
+        return self.data_store.get_or_build(
+            'indice_ubicacion',
+            lambda: LocationIndex(self.data_store.get('ubicacion'),
+                                  guardado=self.snapshot_store.load_artifact('ubicacion', 'indice')),
+            depende_de=('ubicacion',))
+
+    def save_location_index(self, indice):
+        if indice.modificado:
+            self.snapshot_store.save_artifact('ubicacion', 'indice', indice.to_dict())
+            indice.modificado = False
+
+    def get_student_view(self):
+        """Vista de estudiantes con índices por cédula y período"""
+        return self.data_store.get_or_build('vista_estudiantes',
+                                            lambda: StudentView(self.data_store.get('estudiantes')),
+                                            depende_de=('estudiantes',))
+
+    def get_student_index(self):
+        """Índice de búsqueda por nombre sobre la tabla de estudiantes de la sesión"""
+        return self.data_store.get_or_build(
+            'indice_estudiantes',
+            lambda: StudentSearchIndex(self.data_store.get('estudiantes')['Apellidos y Nombres del Estudiante']),
+            depende_de=('estudiantes',))
+
+    def get_render_pool(self, tareas):
+        """Grupo de procesos para dibujar gráficos (None si no hay ventaja en paralelizar)"""
+        if tareas < 2 or (os.cpu_count() or 1) < 2:
+            return None
+        if self.render_pool is None:
+            self.render_pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count()))
+        return self.render_pool
+
+    def get_oficio_template(self, ruta="Formato Oficio - Editable.docx"):
+        """Plantilla de oficio compilada; se vuelve a compilar solo si el archivo cambió"""
+        firma = (os.path.abspath(ruta), os.path.getmtime(ruta), os.path.getsize(ruta))
+        if self.plantilla_oficio is None or self.plantilla_oficio[0] != firma:
+            self.plantilla_oficio = (firma, OficioTemplate(ruta))
+        return self.plantilla_oficio[1]
+
     def update_status(self, message, color="blue"):
+        if not self.jobs.en_hilo_ui():
+            self.jobs.post(self.update_status, message, color)
+            return
         self.status_label.config(text=message, fg=color)
-        self.root.update()
+
+    def ui(self, funcion, *args, **kwargs):
+        """Ejecuta una llamada de Tk (diálogos, ventanas, widgets) en el hilo de la interfaz"""
+        return self.jobs.call(funcion, *args, **kwargs)
+
+    def run_job(self, nombre, funcion):
+        """Ejecuta una acción en segundo plano mostrando etapas y tiempo transcurrido"""
+        if not self.jobs.start(nombre, funcion, al_terminar=self.on_job_finished):
+            messagebox.showwarning("Tarea en curso", f"Espere a que termine: {self.jobs.job.nombre}")
+            return
+        self.cancel_button.config(state=tk.NORMAL)
+        self.refresh_job_label()
+
+    def refresh_job_label(self):
+        job = self.jobs.job
+        if job is None or job.fin is not None:
+            return
+        etapa = f" — {job.etapa} ({time.perf_counter() - job.inicio_etapa:.1f}s)" if job.etapa else ""
+        estado = " (cancelando...)" if job.cancelado else ""
+        self.job_label.config(text=f"⏳ {job.nombre}{etapa} | total {job.transcurrido():.1f}s{estado}")
+        self.root.after(200, self.refresh_job_label)
+
+    def on_job_finished(self, job):
+        self.cancel_button.config(state=tk.DISABLED)
+        estado = "🛑 Cancelado" if job.cancelado else "✅ Terminado"
+        resumen = f" ({job.resumen()})" if job.tiempos else ""
+        self.job_label.config(text=f"{estado}: {job.nombre} en {job.transcurrido():.1f}s{resumen}")
+        if job.cancelado:
+            self.update_status(f"Tarea cancelada: {job.nombre}", "orange")
+
+    def cancel_job(self):
+        self.jobs.cancel()
+        self.refresh_job_label()
 
     def validate_period(self, periodo):
         try:
@@ -142,46 +1979,56 @@ class UnifiedReportApp:
             return None
 
     def verify_password(self):
-        """Verifica la contraseña desde la hoja de cálculo pública"""
+        """Verifica la contraseña desde la hoja de cálculo pública (una vez por sesión)"""
         try:
-            df_password = pd.read_csv(self.url_password)
-            password_correcto = str(df_password.iloc[0]['Contraseña'])
+            if self.sesion.touch():
+                return True
+            
+            self.jobs.stage("Verificando credenciales")
+            if not self.sesion.tiene_credencial:
+                df_password = pd.read_csv(io.BytesIO(self.fetch_source('password')))
+                self.sesion.set_credential(str(df_password.iloc[0]['Contraseña']))
+                # Solo queda el hash: se descarta el CSV descargado
+                self.sheet_cache.forget('password')
+                del df_password
             
             for _ in range(3):
-                password = simpledialog.askstring("Inicio de sesión", "Por favor ingrese la contraseña:", show='*')
+                password = self.ui(simpledialog.askstring, "Inicio de sesión", "Por favor ingrese la contraseña:", show='*')
                 if password is None:
                     return False
-                if password == password_correcto:
+                if self.sesion.login(password):
                     return True
                 else:
-                    messagebox.showerror("Error", "Contraseña incorrecta.")
+                    self.ui(messagebox.showerror, "Error", "Contraseña incorrecta.")
             
-            messagebox.showwarning("Acceso denegado", "Se han agotado los intentos.")
+            self.ui(messagebox.showwarning, "Acceso denegado", "Se han agotado los intentos.")
             return False
         except Exception as e:
-            messagebox.showerror("Error", f"Error al verificar la contraseña: {e}")
+            self.ui(messagebox.showerror, "Error", f"Error al verificar la contraseña: {e}")
             return False
 
     def load_data(self):
         """Carga todos los datos necesarios"""
         try:
+            self.jobs.stage("Cargando datos")
             self.update_status("Cargando datos...")
-            df_datos = pd.read_excel(self.url_datos)
-            df_beneficiarios = pd.read_csv(self.url_beneficiarios)
-            df_ubicacion = pd.read_excel(self.url_ubicacion)
+            tablas = self.get_tables(['datos', 'beneficiarios', 'ubicacion'])
+            df_datos = tablas['datos']
+            df_beneficiarios = tablas['beneficiarios']
+            df_ubicacion = tablas['ubicacion']
             
             # NO normalizar nombres de columnas para mantener los nombres originales
             return df_datos, df_beneficiarios, df_ubicacion
         except Exception as e:
             self.update_status("Error cargando datos", "red")
-            messagebox.showerror("Error", f"Error al cargar datos: {str(e)}")
+            self.ui(messagebox.showerror, "Error", f"Error al cargar datos: {str(e)}")
             return None, None, None
 
     def generate_unified_consolidated_report(self):
         """Genera el reporte unificado consolidado con múltiples hojas - CORREGIDO CON FILTRADO POR PERÍODO"""
-        periodo = self.period_entry.get()
+        periodo = self.ui(self.period_entry.get)
         if not self.validate_period(periodo):
-            messagebox.showerror("Error", "Formato de período inválido. Use el formato YYYY-Q")
+            self.ui(messagebox.showerror, "Error", "Formato de período inválido. Use el formato YYYY-Q")
             return
         
         try:
@@ -198,30 +2045,21 @@ class UnifiedReportApp:
             print(f"Buscando período: {periodo}")
             
             # Verificar que las columnas existen en beneficiarios
-            if 'Período de registro' not in df_beneficiarios.columns:
-                messagebox.showerror("Error", f"No se encontró la columna 'Período de registro' en los datos de beneficiarios.\nColumnas disponibles: {list(df_beneficiarios.columns)}")
-                return
-            
-            if 'Centro de Educación' not in df_beneficiarios.columns:
-                messagebox.showerror("Error", f"No se encontró la columna 'Centro de Educación' en los datos de beneficiarios.\nColumnas disponibles: {list(df_beneficiarios.columns)}")
-                return
-            
-            if 'Qué voy a reportar' not in df_beneficiarios.columns:
-                messagebox.showerror("Error", f"No se encontró la columna 'Qué voy a reportar' en los datos de beneficiarios.\nColumnas disponibles: {list(df_beneficiarios.columns)}")
+            if not self.check_beneficiary_columns(df_beneficiarios):
                 return
             
             # CORRECCIÓN PRINCIPAL: Filtrar instituciones por período
-            if 'Período' in df_datos.columns:
-                # Convertir la columna Período a formato YYYY-Q
-                df_datos['Período_Convertido'] = df_datos['Período'].apply(self.convert_timestamp_to_period)
-                print(f"Períodos únicos en instituciones: {df_datos['Período_Convertido'].unique()}")
+            if 'Período_Convertido' in df_datos.columns:
+                # La columna Período ya viene convertida a formato YYYY-Q desde la instantánea
+                particion_datos = self.get_partition('datos')
+                print(f"Períodos únicos en instituciones: {particion_datos.periodos()}")
                 
                 # Filtrar instituciones por período
-                df_datos_filtrado = df_datos[df_datos['Período_Convertido'] == periodo]
+                df_datos_filtrado = particion_datos.select(periodo)
                 print(f"Instituciones encontradas para {periodo}: {len(df_datos_filtrado)}")
                 
                 if df_datos_filtrado.empty:
-                    messagebox.showwarning("Sin datos de instituciones", f"No se encontraron instituciones para el período {periodo}")
+                    self.ui(messagebox.showwarning, "Sin datos de instituciones", f"No se encontraron instituciones para el período {periodo}")
                     # Continuar con df_datos original para no bloquear el proceso
                     df_datos_filtrado = df_datos
             else:
@@ -229,125 +2067,51 @@ class UnifiedReportApp:
                 df_datos_filtrado = df_datos
             
             # Filtrar beneficiarios por período
-            df_beneficiarios_filtrado = df_beneficiarios[df_beneficiarios['Período de registro'] == periodo]
+            df_beneficiarios_filtrado = self.get_partition('beneficiarios').select(periodo)
             print(f"Registros de beneficiarios encontrados para {periodo}: {len(df_beneficiarios_filtrado)}")
             
             if df_beneficiarios_filtrado.empty:
-                messagebox.showwarning("Sin datos", f"No se encontraron datos de beneficiarios para el período {periodo}")
+                self.ui(messagebox.showwarning, "Sin datos", f"No se encontraron datos de beneficiarios para el período {periodo}")
                 return
             
-            # === GENERAR HOJA DE BENEFICIARIOS ===
-            centros = pd.DataFrame({'Centro de Educación': df_beneficiarios_filtrado['Centro de Educación'].unique()})
+            # Reutilizar el reporte si sus entradas no cambiaron
+            archivo_consolidado = os.path.join(self.directorio_destino, f"Reporte_Unificado_Consolidado_{periodo}.xlsx")
+            huella = self.consolidated_fingerprint(periodo, df_beneficiarios_filtrado, df_datos_filtrado, df_ubicacion)
+            if self.build_cache.is_fresh(archivo_consolidado, huella):
+                self.update_status(f"Reporte consolidado sin cambios: {archivo_consolidado}", "green")
+                self.ui(messagebox.showinfo, "Sin cambios",
+                        f"Los datos del período {periodo} no cambiaron desde la última generación.\n\n"
+                        f"Se conserva el archivo existente:\n{archivo_consolidado}")
+                return
             
-            # Categories and their corresponding filters
+            # === GENERAR HOJAS DE BENEFICIARIOS Y ACTIVIDADES ===
+            self.jobs.stage("Calculando métricas")
             print("Valores únicos en 'Qué voy a reportar':")
             valores_reportar = df_beneficiarios_filtrado['Qué voy a reportar'].unique()
             for i, valor in enumerate(valores_reportar):
                 print(f"  {i+1}. \"{valor}\"")
             
-            categorias = {
-                'Atenciones Individuales': 'Estudiante atendido Individualmente',
-                'Asesorías': 'Asesorías a funcionarios',
-                'Evaluaciones Psicopedagógicas': 'Beneficiarios de evaluación psicopedagógica',
-                'DIAC': 'Beneficiarios DIAC o plan de intervención',
-                'Capacitaciones Funcionarios': 'Capacitación a funcionario(s) (Docentes u otros)',
-                'Sensibilizaciones': 'Sensibilización',
-                'Capacitaciones Padres': 'Capacitación a padres de familia'
-            }
-            
-            # Calculate counts for each category
-            resultados = {}
-            for nombre, filtro in categorias.items():
-                data = df_beneficiarios_filtrado[df_beneficiarios_filtrado['Qué voy a reportar'] == filtro]
-                print(f"Categoría '{nombre}' con filtro '{filtro}': {len(data)} registros")
-                resultados[nombre] = centros['Centro de Educación'].map(
-                    data['Centro de Educación'].value_counts()
-                ).fillna(0).astype(int)
-            
-            # Calculate additional metrics
-            sensibilizaciones = df_beneficiarios_filtrado[df_beneficiarios_filtrado['Qué voy a reportar'] == 'Sensibilización']
-            
-            # Verificar si existe la columna de participantes en sensibilización
-            col_participantes_sensibilizacion = None
-            for col in df_beneficiarios.columns:
-                if 'participantes' in col.lower() and 'sensibilización' in col.lower():
-                    col_participantes_sensibilizacion = col
-                    break
-            
-            if col_participantes_sensibilizacion:
-                print(f"Usando columna para participantes en sensibilización: '{col_participantes_sensibilizacion}'")
-                personas_sensibilizadas = centros['Centro de Educación'].map(
-                    sensibilizaciones.groupby('Centro de Educación')[col_participantes_sensibilizacion].sum()
-                ).fillna(0).astype(int)
-            else:
-                print("⚠️ No se encontró columna de participantes en sensibilización, usando 0")
-                personas_sensibilizadas = centros['Centro de Educación'].map(lambda x: 0)
-            
-            capacitaciones_padres = df_beneficiarios_filtrado[df_beneficiarios_filtrado['Qué voy a reportar'] == 'Capacitación a padres de familia']
-            
-            # Verificar si existe la columna de padres capacitados
-            col_padres_capacitados = None
-            for col in df_beneficiarios.columns:
-                if 'padres' in col.lower() and 'capacitación' in col.lower() and 'número' in col.lower():
-                    col_padres_capacitados = col
-                    break
-            
-            if col_padres_capacitados:
-                print(f"Usando columna para padres capacitados: '{col_padres_capacitados}'")
-                padres_capacitados = centros['Centro de Educación'].map(
-                    capacitaciones_padres.groupby('Centro de Educación')[col_padres_capacitados].sum()
-                ).fillna(0).astype(int)
-            else:
-                print("⚠️ No se encontró columna de padres capacitados, usando 0")
-                padres_capacitados = centros['Centro de Educación'].map(lambda x: 0)
-            
-            # Create Beneficiarios sheet
-            beneficiarios = centros.copy()
-            beneficiarios['Atenciones Individuales'] = resultados['Atenciones Individuales']
-            beneficiarios['Asesorías'] = resultados['Asesorías']
-            beneficiarios['Personas Sensibilizadas'] = personas_sensibilizadas
-            beneficiarios['Padres y Cuidadores Capacitados'] = padres_capacitados
-            beneficiarios['Evaluaciones Psicopedagógicas'] = resultados['Evaluaciones Psicopedagógicas']
-            beneficiarios['DIAC'] = resultados['DIAC']
-            
-            # Create Actividades sheet
-            actividades = centros.copy()
-            actividades['Capacitaciones Funcionarios'] = resultados['Capacitaciones Funcionarios']
-            actividades['Sensibilizaciones'] = resultados['Sensibilizaciones']
-            actividades['Capacitaciones Padres'] = resultados['Capacitaciones Padres']
+            # Todas las categorías y sumas de participantes en una sola pasada agrupada
+            hojas = build_consolidated_sheets(df_beneficiarios_filtrado)
+            beneficiarios = hojas['Beneficiarios']
+            actividades = hojas['Actividades']
             
             # === GENERAR HOJA DE CENTROS FILTRADA POR PERÍODO ===
-            print(f"Columnas en df_datos_filtrado: {list(df_datos_filtrado.columns)}")
-            print(f"Columnas en df_ubicacion: {list(df_ubicacion.columns)}")
-            
-            # CORRECCIÓN: Usar df_datos_filtrado en lugar de df_datos
-            df_centros = df_datos_filtrado.merge(df_ubicacion, how='left', 
-                                               left_on='Nombre Corto de la Institución', 
-                                               right_on='INSTITUCIÓN')
-            
-            print(f"✅ Centros después del filtrado por período: {len(df_centros)}")
-            
-            # Agregar enlaces de Google Maps si hay coordenadas
-            if 'LATITUD' in df_centros.columns and 'LONGITUD' in df_centros.columns:
-                df_centros['dirección_en_google_maps'] = "https://www.google.com/maps?q=" + \
-                                                       df_centros['LATITUD'].astype(str) + "," + \
-                                                       df_centros['LONGITUD'].astype(str)
+            df_centros = self.build_centros_sheet(df_datos_filtrado, df_ubicacion)
             
             # === GUARDAR ARCHIVO CONSOLIDADO ===
-            archivo_consolidado = os.path.join(self.directorio_destino, f"Reporte_Unificado_Consolidado_{periodo}.xlsx")
-            
-            with pd.ExcelWriter(archivo_consolidado, engine='openpyxl') as writer:
-                # Hoja 1: Beneficiarios
-                beneficiarios.to_excel(writer, sheet_name='Beneficiarios', index=False)
-                
-                # Hoja 2: Actividades  
-                actividades.to_excel(writer, sheet_name='Actividades', index=False)
-                
-                # Hoja 3: Centros de Educación (AHORA FILTRADA POR PERÍODO)
-                df_centros.to_excel(writer, sheet_name='Centros_Educacion', index=False)
+            self.jobs.stage("Guardando reporte")
+            archivos = self.write_consolidated_report({
+                'Beneficiarios': beneficiarios,
+                'Actividades': actividades,
+                'Centros_Educacion': df_centros,
+            }, archivo_consolidado)
+            self.build_cache.record(archivo_consolidado, huella, archivos, periodo=periodo,
+                                    filas_beneficiarios=len(df_beneficiarios_filtrado),
+                                    filas_instituciones=len(df_datos_filtrado))
             
             self.update_status(f"Reporte consolidado generado: {archivo_consolidado}", "green")
-            messagebox.showinfo("Éxito", 
+            self.ui(messagebox.showinfo, "Éxito", 
                               f"Reporte Unificado Consolidado generado exitosamente.\n\n"
                               f"Archivo: {archivo_consolidado}\n\n"
                               f"Registros procesados:\n"
@@ -360,7 +2124,163 @@ class UnifiedReportApp:
             
         except Exception as e:
             self.update_status("Error generando reporte consolidado", "red")
-            messagebox.showerror("Error", f"Error: {str(e)}")
+            self.ui(messagebox.showerror, "Error", f"Error: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+    def check_beneficiary_columns(self, df_beneficiarios):
+        """Verifica que la base de beneficiarios tenga las columnas del reporte consolidado"""
+        for columna in ('Período de registro', COLUMNA_CENTRO, COLUMNA_CATEGORIA):
+            if columna not in df_beneficiarios.columns:
+                self.ui(messagebox.showerror, "Error", f"No se encontró la columna '{columna}' en los datos de beneficiarios.\nColumnas disponibles: {list(df_beneficiarios.columns)}")
+                return False
+        return True
+
+    def build_centros_sheet(self, df_datos_filtrado, df_ubicacion):
+        """Arma la hoja Centros_Educacion: instituciones del período con su ubicación"""
+        print(f"Columnas en df_datos_filtrado: {list(df_datos_filtrado.columns)}")
+        print(f"Columnas en df_ubicacion: {list(df_ubicacion.columns)}")
+        
+        # CORRECCIÓN: Usar df_datos_filtrado en lugar de df_datos
+        # Emparejar por nombre normalizado (mayúsculas, tildes y espacios no importan)
+        if 'INSTITUCIÓN' in df_ubicacion.columns and 'Nombre Corto de la Institución' in df_datos_filtrado.columns:
+            indice = self.get_location_index()
+            df_centros = indice.join(df_datos_filtrado, 'Nombre Corto de la Institución')
+            self.save_location_index(indice)
+        else:
+            df_centros = df_datos_filtrado.merge(df_ubicacion, how='left', 
+                                               left_on='Nombre Corto de la Institución', 
+                                               right_on='INSTITUCIÓN')
+        
+        print(f"✅ Centros después del filtrado por período: {len(df_centros)}")
+        
+        # Agregar enlaces de Google Maps si hay coordenadas
+        if 'LATITUD' in df_centros.columns and 'LONGITUD' in df_centros.columns:
+            df_centros['dirección_en_google_maps'] = "https://www.google.com/maps?q=" + \
+                                                   df_centros['LATITUD'].astype(str) + "," + \
+                                                   df_centros['LONGITUD'].astype(str)
+        return df_centros
+
+    def write_consolidated_report(self, hojas, archivo):
+        """Guarda las hojas del reporte consolidado (Beneficiarios, Actividades, Centros_Educacion)"""
+        archivos = write_sheets(hojas, archivo, self.motor_excel, self.formato_adicional)
+        print(f"💾 Archivos escritos ({self.motor_excel}): {archivos}")
+        return archivos
+
+    def consolidated_fingerprint(self, periodo, df_beneficiarios_filtrado, df_datos_filtrado, df_ubicacion):
+        """Huella de todo lo que determina el contenido de un reporte consolidado"""
+        return fingerprint(df_beneficiarios_filtrado, df_datos_filtrado, df_ubicacion, periodo,
+                           REPORT_CODE_VERSION, self.motor_excel, self.formato_adicional)
+
+    def expand_period_range(self, texto):
+        """Convierte '2025-1:2025-4' (o una lista separada por comas) en la lista de períodos"""
+        texto = texto.replace(' ', '')
+        if ':' in texto:
+            desde, hasta = texto.split(':', 1)
+            if not (self.validate_period(desde) and self.validate_period(hasta)):
+                return None
+            anio, trimestre = map(int, desde.split('-'))
+            anio_fin, trimestre_fin = map(int, hasta.split('-'))
+            periodos = []
+            while (anio, trimestre) <= (anio_fin, trimestre_fin):
+                periodos.append(f"{anio}-{trimestre}")
+                anio, trimestre = (anio + 1, 1) if trimestre == 4 else (anio, trimestre + 1)
+            return periodos or None
+        
+        periodos = [p for p in texto.split(',') if p]
+        if not periodos or not all(self.validate_period(p) for p in periodos):
+            return None
+        return list(dict.fromkeys(periodos))
+
+    def generate_batch_consolidated_reports(self):
+        """Genera el reporte consolidado de varios períodos con una sola carga de datos"""
+        rango = self.ui(simpledialog.askstring, "Reportes por lote",
+                        "Rango de períodos (ejemplo: 2025-1:2025-4 o 2024-3,2025-1):")
+        if not rango:
+            return
+        periodos = self.expand_period_range(rango)
+        if not periodos:
+            self.ui(messagebox.showerror, "Error", "Rango de períodos inválido. Use el formato YYYY-Q:YYYY-Q")
+            return
+        combinado = self.ui(messagebox.askyesno, "Libro combinado",
+                            f"Se generarán {len(periodos)} reportes ({periodos[0]} a {periodos[-1]}).\n\n"
+                            "¿Desea generar también un libro combinado con todos los períodos?")
+        
+        try:
+            df_datos, df_beneficiarios, df_ubicacion = self.load_data()
+            if df_beneficiarios is None:
+                return
+            if not self.check_beneficiary_columns(df_beneficiarios):
+                return
+            os.makedirs(self.directorio_destino, exist_ok=True)
+            
+            # Métricas de todos los períodos en una sola agrupación (período, centro)
+            self.jobs.stage("Calculando métricas")
+            particion_beneficiarios = self.get_partition('beneficiarios')
+            particion_datos = self.get_partition('datos') if 'Período_Convertido' in df_datos.columns else None
+            df_rango = pd.concat([particion_beneficiarios.select(p) for p in periodos])
+            metricas = compute_metrics(df_rango, claves=('Período de registro', COLUMNA_CENTRO))
+            periodos_con_datos = set(metricas.index.get_level_values(0))
+            
+            self.jobs.stage("Guardando reportes")
+            generados, omitidos, sin_cambios, incluidos, hojas_combinadas = [], [], [], [], {}
+            for periodo in periodos:
+                self.jobs.check_cancelled()
+                df_beneficiarios_filtrado = particion_beneficiarios.select(periodo)
+                if df_beneficiarios_filtrado.empty:
+                    print(f"⚠️ Sin beneficiarios para {periodo}, se omite")
+                    omitidos.append(periodo)
+                    continue
+                self.update_status(f"Generando reporte {periodo} ({len(incluidos) + 1}/{len(periodos)})...")
+                
+                metricas_periodo = metricas.xs(periodo, level=0) if periodo in periodos_con_datos else None
+                hojas = build_consolidated_sheets(df_beneficiarios_filtrado, metricas_periodo)
+                
+                df_datos_filtrado = particion_datos.select(periodo) if particion_datos else df_datos
+                if df_datos_filtrado.empty:
+                    print(f"⚠️ No se encontraron instituciones para {periodo}, usando todas las instituciones")
+                    df_datos_filtrado = df_datos
+                hojas['Centros_Educacion'] = self.build_centros_sheet(df_datos_filtrado, df_ubicacion)
+                
+                archivo = os.path.join(self.directorio_destino, f"Reporte_Unificado_Consolidado_{periodo}.xlsx")
+                huella = self.consolidated_fingerprint(periodo, df_beneficiarios_filtrado, df_datos_filtrado, df_ubicacion)
+                if self.build_cache.is_fresh(archivo, huella):
+                    print(f"⚡ Reporte {periodo} sin cambios, se conserva el existente")
+                    sin_cambios.append(periodo)
+                else:
+                    archivos = self.write_consolidated_report(hojas, archivo)
+                    self.build_cache.record(archivo, huella, archivos, periodo=periodo,
+                                            filas_beneficiarios=len(df_beneficiarios_filtrado),
+                                            filas_instituciones=len(df_datos_filtrado))
+                    generados.append(periodo)
+                incluidos.append(periodo)
+                
+                for nombre_hoja, tabla in hojas.items():
+                    tabla = tabla.copy()
+                    tabla.insert(0, 'Período del reporte', periodo)
+                    hojas_combinadas.setdefault(nombre_hoja, []).append(tabla)
+            
+            mensaje = f"Reportes generados: {len(generados)}"
+            if sin_cambios:
+                mensaje += f"\nSin cambios (se conservan los existentes): {', '.join(sin_cambios)}"
+            if omitidos:
+                mensaje += f"\nPeríodos sin datos (omitidos): {', '.join(omitidos)}"
+            # El libro combinado incluye tanto los reportes nuevos como los que no cambiaron
+            if combinado and incluidos:
+                archivo_combinado = os.path.join(self.directorio_destino,
+                                                 f"Reporte_Unificado_Consolidado_{incluidos[0]}_a_{incluidos[-1]}.xlsx")
+                self.write_consolidated_report({
+                    nombre_hoja: pd.concat(tablas, ignore_index=True)
+                    for nombre_hoja, tablas in hojas_combinadas.items()
+                }, archivo_combinado)
+                mensaje += f"\nLibro combinado: {archivo_combinado}"
+            
+            self.update_status(f"Reportes por lote generados en: {self.directorio_destino}", "green")
+            self.ui(messagebox.showinfo, "Éxito", mensaje)
+            
+        except Exception as e:
+            self.update_status("Error generando reportes por lote", "red")
+            self.ui(messagebox.showerror, "Error", f"Error: {str(e)}")
             import traceback
             traceback.print_exc()
 
@@ -374,55 +2294,69 @@ class UnifiedReportApp:
     def student_consultation_window(self):
         """Ventana para consulta de estudiantes"""
         try:
-            # Cargar datos de estudiantes
-            df_estudiantes = pd.read_excel(self.url_datos)
-            df_ubicaciones = pd.read_excel(self.url_ubicacion)
-            
-            # Convertir la columna Período a formato YYYY-Q
-            if 'Período' in df_estudiantes.columns:
-                df_estudiantes['Período_Convertido'] = df_estudiantes['Período'].apply(self.convert_timestamp_to_period)
-            
-            # Usar los nombres exactos de las columnas
-            if 'INSTITUCIÓN' in df_ubicaciones.columns and 'LATITUD' in df_ubicaciones.columns and 'LONGITUD' in df_ubicaciones.columns:
-                # Renombrar columnas para estandarizar
-                df_ubicaciones = df_ubicaciones.rename(columns={
-                    'INSTITUCIÓN': 'Nombre Corto de la Institución',
-                    'LATITUD': 'Latitud',
-                    'LONGITUD': 'Longitud'
-                })
-                
-                # Convertir a string las columnas de institución
-                if 'Nombre Corto de la Institución' in df_estudiantes.columns:
-                    df_estudiantes['Nombre Corto de la Institución'] = df_estudiantes['Nombre Corto de la Institución'].astype(str)
-                if 'Nombre Corto de la Institución' in df_ubicaciones.columns:
-                    df_ubicaciones['Nombre Corto de la Institución'] = df_ubicaciones['Nombre Corto de la Institución'].astype(str)
-                
-                # Merge de los dataframes
-                df_combinado = pd.merge(
-                    df_estudiantes,
-                    df_ubicaciones[['Nombre Corto de la Institución', 'Latitud', 'Longitud']],
-                    on='Nombre Corto de la Institución',
-                    how='left'
-                )
-            else:
-                # Continuar sin datos de ubicación
-                df_combinado = df_estudiantes.copy()
-                df_combinado['Latitud'] = None
-                df_combinado['Longitud'] = None
-            
-            self.show_student_search_dialog(df_combinado)
+            self.jobs.stage("Cargando datos de estudiantes")
+            df_combinado = self.data_store.get_or_build('estudiantes', self.build_student_table,
+                                                        depende_de=('datos', 'ubicacion'))
+            # Los índices se construyen aquí, fuera del hilo de la interfaz
+            self.jobs.stage("Indexando estudiantes")
+            vista = self.get_student_view()
+            if 'Apellidos y Nombres del Estudiante' in df_combinado.columns:
+                self.get_student_index()
+            self.ui(self.show_student_search_dialog, vista)
             
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
             print("Error en student_consultation_window:", error_details)
-            messagebox.showerror("Error", f"Error al cargar datos de estudiantes: {e}")
+            self.ui(messagebox.showerror, "Error", f"Error al cargar datos de estudiantes: {e}")
+
+    def build_student_table(self):
+        """Une los datos de estudiantes con las ubicaciones (una vez por sesión)"""
+        tablas = self.get_tables(['datos', 'ubicacion'])
+        df_estudiantes = tablas['datos']
+        df_ubicaciones = tablas['ubicacion']
+        
+        # Usar los nombres exactos de las columnas
+        if ('INSTITUCIÓN' in df_ubicaciones.columns and 'LATITUD' in df_ubicaciones.columns and
+                'LONGITUD' in df_ubicaciones.columns and 'Nombre Corto de la Institución' in df_estudiantes.columns):
+            # Búsqueda en el índice de ubicaciones por nombre normalizado
+            indice = self.get_location_index()
+            coordenadas = indice.lookup(df_estudiantes['Nombre Corto de la Institución'], ['LATITUD', 'LONGITUD'])
+            self.save_location_index(indice)
+            coordenadas = coordenadas.rename(columns={'LATITUD': 'Latitud', 'LONGITUD': 'Longitud'})
+            coordenadas.index = df_estudiantes.index
+        else:
+            # Continuar sin datos de ubicación
+            coordenadas = pd.DataFrame({'Latitud': None, 'Longitud': None}, index=df_estudiantes.index)
+        
+        # Se añaden columnas sin copiar ni alterar la tabla compartida de la sesión
+        if {'Latitud', 'Longitud'} & set(df_estudiantes.columns):
+            df_estudiantes = df_estudiantes.drop(columns=['Latitud', 'Longitud'], errors='ignore')
+        return pd.concat([df_estudiantes, coordenadas], axis=1, copy=False)
 
-    def show_student_search_dialog(self, df_estudiantes):
-        """Muestra el diálogo de búsqueda de estudiantes"""
+    def show_student_search_dialog(self, vista):
+        """Muestra el diálogo de búsqueda de estudiantes (por nombre o cédula) con resultados mientras se escribe"""
+        df_estudiantes = vista.df
+        if 'Apellidos y Nombres del Estudiante' not in df_estudiantes.columns:
+            messagebox.showerror("Error", "No se encontró la columna de nombres de estudiantes")
+            return
+        indice = self.get_student_index()
+        
+        # Columnas de la lista de resultados (referencias a las columnas, sin copiar la tabla)
+        columnas = {
+            'nombre': ("Apellidos y Nombres del Estudiante", 280),
+            'periodo': ("Período_Convertido", 80),
+            'institucion': ("Nombre Completo de la Institución", 280),
+        }
+        valores = {
+            clave: (df_estudiantes[columna].to_numpy(dtype=object) if columna in df_estudiantes.columns
+                    else np.full(len(df_estudiantes), 'N/A', dtype=object))
+            for clave, (columna, _) in columnas.items()
+        }
+        
         search_window = tk.Toplevel(self.root)
         search_window.title("Consulta de Estudiantes")
-        search_window.geometry("500x300")
+        search_window.geometry("720x560")
         
         # Frame principal
         main_frame = tk.Frame(search_window)
@@ -441,106 +2375,147 @@ class UnifiedReportApp:
         
         # Nombre del estudiante
         name_frame = tk.Frame(main_frame)
-        name_frame.pack(pady=10)
-        tk.Label(name_frame, text="Nombre del estudiante:", font=("Arial", 12)).pack()
+        name_frame.pack(pady=5)
+        tk.Label(name_frame, text="Nombre o cédula del estudiante:", font=("Arial", 12)).pack()
         search_entry = tk.Entry(name_frame, width=40, font=("Arial", 10))
         search_entry.pack(pady=5)
         
-        # Resultado
+        # Resultados
         result_frame = tk.Frame(main_frame)
-        result_frame.pack(fill='both', expand=True, pady=10)
+        result_frame.pack(fill='both', expand=True, pady=5)
+        arbol = ttk.Treeview(result_frame, columns=list(columnas), show='headings', selectmode='browse')
+        scrollbar = ttk.Scrollbar(result_frame, orient="vertical", command=arbol.yview)
+        arbol.configure(yscrollcommand=scrollbar.set)
+        arbol.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        
+        page_frame = tk.Frame(main_frame)
+        page_frame.pack(fill='x')
+        page_label = tk.Label(page_frame, text="Escriba al menos 2 letras del nombre o la cédula", fg="gray30")
+        
+        estado = {'resultados': np.array([], dtype=np.int64), 'pagina': 0, 'orden': None,
+                  'descendente': False, 'consulta': 0, 'pendiente': None}
+        consultas = ThreadPoolExecutor(max_workers=1)
+        
+        def mostrar_pagina():
+            arbol.delete(*arbol.get_children())
+            resultados = estado['resultados']
+            paginas = max(1, -(-len(resultados) // self.FILAS_POR_PAGINA))
+            estado['pagina'] = min(estado['pagina'], paginas - 1)
+            inicio = estado['pagina'] * self.FILAS_POR_PAGINA
+            for posicion in resultados[inicio:inicio + self.FILAS_POR_PAGINA]:
+                arbol.insert('', tk.END, iid=str(posicion), values=[
+                    'N/A' if pd.isna(valores[clave][posicion]) else valores[clave][posicion] for clave in columnas])
+            if len(resultados):
+                page_label.config(text=f"Página {estado['pagina'] + 1} de {paginas} ({len(resultados)} resultados)")
+            elif len(search_entry.get().strip()) >= 2:
+                page_label.config(text="No se encontraron estudiantes con ese nombre o cédula.")
+        
+        def aplicar_orden():
+            if estado['orden'] is None or not len(estado['resultados']):
+                return
+            claves = pd.Series(valores[estado['orden']][estado['resultados']]).fillna('').astype(str).str.casefold()
+            orden = np.argsort(claves.to_numpy(), kind='stable')
+            estado['resultados'] = estado['resultados'][orden[::-1] if estado['descendente'] else orden]
+        
+        def ordenar(clave):
+            if estado['orden'] == clave:
+                estado['descendente'] = not estado['descendente']
+            else:
+                estado['orden'], estado['descendente'] = clave, False
+            aplicar_orden()
+            estado['pagina'] = 0
+            mostrar_pagina()
+        
+        for clave, (titulo, ancho) in columnas.items():
+            arbol.heading(clave, text=titulo.replace('_Convertido', ''), command=lambda c=clave: ordenar(c))
+            arbol.column(clave, width=ancho, anchor='w')
+        
+        def recibir(numero, resultados):
+            # Descarta respuestas de consultas que ya fueron reemplazadas por otra
+            if numero != estado['consulta'] or not search_window.winfo_exists():
+                return
+            estado['resultados'], estado['pagina'] = resultados, 0
+            aplicar_orden()
+            mostrar_pagina()
+        
+        def ejecutar(numero, nombre, permitidas):
+            if numero != estado['consulta']:
+                return
+            inicio = time.perf_counter()
+            # Una consulta con dígitos se busca como cédula exacta en el índice hash
+            if any(caracter.isdigit() for caracter in nombre):
+                resultados = vista.by_id(nombre, permitidas)
+            else:
+                resultados = indice.search(nombre, permitidas)
+            print(f"🔎 Consulta de estudiantes: {len(resultados)} resultados en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+            self.jobs.post(recibir, numero, resultados)
         
         def buscar_estudiante():
+            estado['pendiente'] = None
+            estado['consulta'] += 1
             nombre = search_entry.get().strip()
             periodo_filtro = period_entry.get().strip()
-            
-            if not nombre:
-                messagebox.showwarning("Advertencia", "Por favor ingrese un nombre")
+        
+            if len(nombre) < 2:
+                estado['resultados'] = np.array([], dtype=np.int64)
+                page_label.config(text="Escriba al menos 2 letras del nombre o la cédula")
+                mostrar_pagina()
                 return
-            
+        
             # Filtrar por período si se especifica
-            df_filtrado = df_estudiantes.copy()
+            permitidas = None
             if periodo_filtro:
-                if 'Período_Convertido' in df_filtrado.columns:
-                    df_filtrado = df_filtrado[df_filtrado['Período_Convertido'] == periodo_filtro]
-                else:
-                    messagebox.showwarning("Advertencia", "No se pudo filtrar por período")
-            
-            resultado = self.search_student(df_filtrado, nombre)
-            if resultado is not None and not resultado.empty:
-                search_window.destroy()
-                self.show_student_info(resultado)
+                permitidas = vista.in_period(periodo_filtro)
+                if permitidas is None:
+                    page_label.config(text="No se pudo filtrar por período")
+            consultas.submit(ejecutar, estado['consulta'], nombre, permitidas)
+        
+        def programar_busqueda(event=None):
+            # Espera a que el usuario deje de escribir antes de consultar
+            if estado['pendiente'] is not None:
+                search_window.after_cancel(estado['pendiente'])
+            estado['pendiente'] = search_window.after(self.ESPERA_BUSQUEDA_MS, buscar_estudiante)
+        
+        def buscar_ahora(event=None):
+            if estado['pendiente'] is not None:
+                search_window.after_cancel(estado['pendiente'])
+            buscar_estudiante()
+        
+        def cambiar_pagina(delta):
+            estado['pagina'] = max(0, estado['pagina'] + delta)
+            mostrar_pagina()
         
-        # Botón de búsqueda
-        tk.Button(main_frame, text="Buscar Estudiante", command=buscar_estudiante, 
+        def ver_estudiante(event=None):
+            seleccion = arbol.selection()
+            if not seleccion:
+                messagebox.showwarning("Selección", "Seleccione un estudiante de la lista", parent=search_window)
+                return
+            self.show_student_info(vista.rows([int(seleccion[0])]))
+        
+        def cerrar():
+            # Una búsqueda programada se ejecutaría sobre la ventana ya destruida
+            if estado['pendiente'] is not None:
+                search_window.after_cancel(estado['pendiente'])
+                estado['pendiente'] = None
+            estado['consulta'] += 1
+            consultas.shutdown(wait=False, cancel_futures=True)
+            search_window.destroy()
+        
+        tk.Button(page_frame, text="◀ Anterior", command=lambda: cambiar_pagina(-1)).pack(side=tk.LEFT)
+        page_label.pack(side=tk.LEFT, expand=True)
+        tk.Button(page_frame, text="Siguiente ▶", command=lambda: cambiar_pagina(1)).pack(side=tk.RIGHT)
+        
+        tk.Button(main_frame, text="Ver Información del Estudiante", command=ver_estudiante,
                  bg="lightblue", font=("Arial", 10, "bold")).pack(pady=10)
         
         search_entry.focus()
-        search_entry.bind('<Return>', lambda event: buscar_estudiante())
-
-    def search_student(self, df_estudiantes, nombre_busqueda):
-        """Busca un estudiante por nombre"""
-        try:
-            if 'Apellidos y Nombres del Estudiante' not in df_estudiantes.columns:
-                messagebox.showerror("Error", "No se encontró la columna de nombres de estudiantes")
-                return None
-            
-            # Convertir a string y limpiar
-            df_estudiantes['Apellidos y Nombres del Estudiante'] = df_estudiantes['Apellidos y Nombres del Estudiante'].astype(str)
-            
-            # Búsqueda exacta primero (case insensitive)
-            coincidencias_exactas = df_estudiantes[
-                df_estudiantes['Apellidos y Nombres del Estudiante'].str.contains(
-                    nombre_busqueda, case=False, na=False, regex=False
-                )
-            ]
-            
-            if not coincidencias_exactas.empty:
-                coincidencias = coincidencias_exactas
-            else:
-                # Búsqueda difusa usando thefuzz
-                nombres = df_estudiantes['Apellidos y Nombres del Estudiante'].dropna().tolist()
-                matches = process.extract(nombre_busqueda, nombres, limit=5)
-                
-                # Filtrar matches con score > 60
-                good_matches = [match for match in matches if match[1] > 60]
-                
-                if good_matches:
-                    nombres_coincidentes = [match[0] for match in good_matches]
-                    coincidencias = df_estudiantes[
-                        df_estudiantes['Apellidos y Nombres del Estudiante'].isin(nombres_coincidentes)
-                    ]
-                else:
-                    coincidencias = pd.DataFrame()
-            
-            if coincidencias.empty:
-                messagebox.showinfo("Sin coincidencias", "No se encontraron estudiantes con ese nombre.")
-                return None
-            
-            if len(coincidencias) > 1:
-                # Mostrar opciones para seleccionar
-                opciones = []
-                for idx, row in coincidencias.iterrows():
-                    nombre = row['Apellidos y Nombres del Estudiante']
-                    periodo = row.get('Período_Convertido', 'N/A')
-                    institucion = row.get('Nombre Completo de la Institución', 'N/A')
-                    opciones.append(f"{nombre} - {periodo} - {institucion}")
-                
-                mensaje = "Se encontraron varios estudiantes:\n" + "\n".join([f"{i+1}. {op}" for i, op in enumerate(opciones)])
-                seleccion = simpledialog.askinteger("Selección", mensaje + "\n\nSeleccione el número:")
-                if seleccion and 1 <= seleccion <= len(opciones):
-                    return coincidencias.iloc[[seleccion - 1]]
-                return None
-            else:
-                return coincidencias
-                    
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            print("Error en search_student:", error_details)
-            messagebox.showerror("Error", f"Error en la búsqueda: {e}")
-            return None
-
+        search_entry.bind('<KeyRelease>', programar_busqueda)
+        period_entry.bind('<KeyRelease>', programar_busqueda)
+        search_entry.bind('<Return>', buscar_ahora)
+        arbol.bind('<Double-1>', ver_estudiante)
+        arbol.bind('<Return>', ver_estudiante)
+        search_window.protocol("WM_DELETE_WINDOW", cerrar)
 
     def show_student_info(self, estudiante):
         """Muestra la información del estudiante"""
@@ -620,147 +2595,210 @@ class UnifiedReportApp:
 
     def generate_beneficiary_analysis(self):
         """Genera análisis de beneficiarios"""
-        periodo = self.period_entry.get()
+        periodo = self.ui(self.period_entry.get)
         if not periodo:
-            messagebox.showerror("Error", "Por favor ingrese un período")
+            self.ui(messagebox.showerror, "Error", "Por favor ingrese un período")
             return
         
         try:
+            self.jobs.stage("Cargando encuesta")
             self.update_status("Generando análisis de beneficiarios...")
             
             # Leer datos de encuesta
-            data = pd.read_csv(self.url_encuesta)
-            data.columns = data.columns.str.strip()
+            self.get_tables(['encuesta'])
             
             # Filtrar por período
-            data = data[data['Periodo'] == periodo]
+            data = self.get_partition('encuesta').select(periodo)
             
             if data.empty:
-                messagebox.showwarning("Sin datos", f"No se encontraron datos para el período {periodo}")
+                self.ui(messagebox.showwarning, "Sin datos", f"No se encontraron datos para el período {periodo}")
                 return
             
             # Crear carpeta de salida
             output_dir = os.path.join(self.directorio_destino, "Beneficiarios")
             os.makedirs(output_dir, exist_ok=True)
             
+            # Perfil de renderizado elegido para esta ejecución
+            perfil = self.perfil_render
+            sufijo = PERFILES_RENDER[perfil]['sufijo']
+            
+            # Reutilizar el análisis si las respuestas del período no cambiaron
+            word_filename = os.path.join(output_dir, f'Beneficiarios_analisis_{periodo}{sufijo}.docx')
+            huella = fingerprint(data, periodo, REPORT_CODE_VERSION, self.motor_excel, self.formato_adicional, perfil,
+                                 self.paginar_graficos, self.exportar_imagenes)
+            if self.build_cache.is_fresh(word_filename, huella):
+                self.update_status(f"Análisis sin cambios: {output_dir}", "green")
+                self.ui(messagebox.showinfo, "Sin cambios",
+                        f"Las respuestas del período {periodo} no cambiaron desde el último análisis.\n\n"
+                        f"Se conservan los archivos existentes en:\n{output_dir}")
+                return
+            
             # Guardar datos en Excel
+            self.jobs.stage("Guardando encuesta")
             excel_filename = os.path.join(output_dir, f'Encuesta_Beneficiarios_{periodo}.xlsx')
-            data.to_excel(excel_filename, index=False)
-            
-            # Generar gráficos
-            self.generate_beneficiary_charts(data, output_dir, periodo)
+            archivos = write_sheets({'Sheet1': data}, excel_filename, self.motor_excel, self.formato_adicional)
             
-            # Generar documento Word
-            self.create_beneficiary_document(output_dir, periodo)
+            # Ranking completo de ciudades e instituciones (los gráficos solo muestran las principales)
+            ranking = {hoja: ranking_table(data[columna].value_counts(), etiqueta)
+                       for hoja, columna, etiqueta in (('Ciudades', 'Ciudad - Institución', 'Ciudad'),
+                                                       ('Instituciones', 'Institución', 'Institución'))
+                       if columna in data.columns}
+            if ranking:
+                archivos += write_sheets(ranking, os.path.join(output_dir, f'Ranking_respuestas_{periodo}.xlsx'),
+                                         self.motor_excel, self.formato_adicional)
             
-            self.update_status(f"Análisis de beneficiarios completado en: {output_dir}", "green")
-            messagebox.showinfo("Éxito", f"Análisis completado. Archivos guardados en:\n{output_dir}")
+            # Generar gráficos
+            self.jobs.stage(f"Generando gráficos ({perfil})")
+            inicio = time.perf_counter()
+            imagenes, exportadas = self.generate_beneficiary_charts(data, output_dir, periodo, perfil,
+                                                                    self.exportar_imagenes)
+            archivos += exportadas
+            segundos_graficos = time.perf_counter() - inicio
+            
+            # Generar documento Word directamente desde las imágenes en memoria
+            self.jobs.stage("Generando documento Word")
+            inicio = time.perf_counter()
+            archivos.append(self.create_beneficiary_document(output_dir, periodo, imagenes, perfil))
+            segundos_documento = time.perf_counter() - inicio
+            self.build_cache.record(word_filename, huella, archivos, periodo=periodo, respuestas=len(data), perfil=perfil)
+            
+            self.update_status(f"Análisis de beneficiarios ({perfil}) completado en: {output_dir} "
+                               f"(gráficos {segundos_graficos:.1f}s, documento {segundos_documento:.1f}s)", "green")
+            self.ui(messagebox.showinfo, "Éxito", f"Análisis completado. Archivos guardados en:\n{output_dir}")
             
         except Exception as e:
             self.update_status("Error en análisis de beneficiarios", "red")
-            messagebox.showerror("Error", f"Error: {str(e)}")
-
-    def generate_beneficiary_charts(self, data, output_dir, periodo):
-        """Genera gráficos para el análisis de beneficiarios"""
-        plt.style.use('default')
-        
-        # 1. Gráfico de Ciudad
-        if 'Ciudad - Institución' in data.columns:
-            plt.figure(figsize=(10, 6))
-            city_counts = data['Ciudad - Institución'].value_counts()
-            city_counts.plot(kind='bar', color='skyblue')
-            plt.title('Distribución de Respuestas por Ciudad')
-            plt.xlabel('Ciudad')
-            plt.ylabel('Número de Respuestas')
-            plt.xticks(rotation=45, ha='right')
-            for index, value in enumerate(city_counts):
-                plt.text(index, value + 0.5, f'{value}\n({value / city_counts.sum() * 100:.1f}%)', 
-                        ha='center', va='bottom')
-            plt.tight_layout()
-            plt.savefig(os.path.join(output_dir, f'ciudad_distribution_{periodo}.jpg'), dpi=300, bbox_inches='tight')
-            plt.close()
-        
-        # 2. Gráfico de Institución
-        if 'Institución' in data.columns:
-            plt.figure(figsize=(12, 8))
-            institution_counts = data['Institución'].value_counts()
-            institution_counts.plot(kind='barh', color='lightgreen')
-            plt.title('Distribución de Respuestas por Institución')
-            plt.xlabel('Número de Respuestas')
-            plt.ylabel('Institución')
-            for index, value in enumerate(institution_counts):
-                plt.text(value + 0.5, index, f'{value}\n({value / institution_counts.sum() * 100:.1f}%)', 
-                        va='center')
-            plt.tight_layout()
-            plt.savefig(os.path.join(output_dir, f'institucion_distribution_{periodo}.jpg'), dpi=300, bbox_inches='tight')
-            plt.close()
-        
-        # Generar nubes de palabras si existen las columnas correspondientes
-        stop_words_spanish = {
-            'el', 'la', 'los', 'las', 'un', 'una', 'de', 'del', 'a', 'al', 'que', 'en', 'por', 'para',
-            'con', 'sin', 'sobre', 'y', 'o', 'pero', 'también', 'ni', 'como', 'muy', 'no', 'ha', 'su',
-            'estudiante', 'estudiantes', 'niño', 'niña', 'niños', 'niñas', 'actividad', 'actividades'
-        }
+            self.ui(messagebox.showerror, "Error", f"Error: {str(e)}")
+
+    def generate_beneficiary_charts(self, data, output_dir, periodo, perfil='impresion', exportar=True):
+        """Dibuja en memoria los gráficos del análisis de beneficiarios.
+
+        Devuelve ``(imagenes, archivos)``: las imágenes (bytes) de cada sección del
+        documento Word y, si ``exportar``, los archivos de imagen escritos en disco.
+        """
+        opciones = PERFILES_RENDER[perfil]
+        sufijo = opciones['sufijo']
+        tareas = []
+        # Nombre de la tarea -> (sección del documento o None, archivo de exportación)
+        destinos = {}
+        
+        def agregar(seccion, nombre, funcion, datos, base, extension, formatos, estilo):
+            # Imagen para el documento Word y, al exportar en impresión, copias vectoriales
+            tareas.append((nombre, funcion, datos, extension, estilo))
+            destinos[nombre] = (seccion, os.path.join(output_dir, f'{base}{sufijo}.{extension}'))
+            for formato in (formatos if exportar else ()):
+                tareas.append((f"{nombre} ({formato})", funcion, datos, formato, estilo))
+                destinos[f"{nombre} ({formato})"] = (None, os.path.join(output_dir, f'{base}{sufijo}.{formato}'))
+        
+        # 1. Gráfico de Ciudad y 2. Gráfico de Institución: como máximo MAX_BARRAS_GRAFICO barras por
+        # imagen, con el resto agrupado en "Otros" o repartido en páginas
+        for nombre, columna, base, funcion in (
+                ('Ciudad', 'Ciudad - Institución', f'ciudad_distribution_{periodo}', render_city_chart),
+                ('Institución', 'Institución', f'institucion_distribution_{periodo}', render_institution_chart)):
+            if columna not in data.columns:
+                continue
+            conteos = data[columna].value_counts()
+            estilo = {'dpi': opciones['dpi'], 'total': int(conteos.sum())}
+            if self.paginar_graficos and len(conteos) > MAX_BARRAS_GRAFICO:
+                paginas = range(0, len(conteos), MAX_BARRAS_GRAFICO)
+                for numero, inicio in enumerate(paginas, start=1):
+                    agregar(nombre, f"{nombre} {numero}/{len(paginas)}", funcion, conteos.iloc[inicio:inicio + MAX_BARRAS_GRAFICO],
+                            base if numero == 1 else f'{base}_p{numero}', 'jpg', opciones['vectoriales'], estilo)
+            else:
+                agregar(nombre, nombre, funcion, top_n_counts(conteos), base, 'jpg', opciones['vectoriales'], estilo)
         
-        # Nube de palabras para aspectos positivos
+        # Nubes de palabras para aspectos positivos y a mejorar, desde las frecuencias por respuesta
         pos_col = 'Comparta brevemente con nosotros aspectos positivos que ha experimentado u observado durante el proceso  de prácticas o vinculación'
-        if pos_col in data.columns:
-            positive_text = ' '.join(data[pos_col].dropna())
-            if positive_text.strip():
-                wordcloud = WordCloud(width=800, height=400, background_color='white', 
-                                    stopwords=stop_words_spanish).generate(positive_text)
-                wordcloud.to_file(os.path.join(output_dir, f'wordcloud_positive_{periodo}.png'))
-        
-        # Nube de palabras para aspectos a mejorar
         imp_col = 'Comparta con nosotros aspectos a mejorar en función de lo que ha experimentado u observado durante el proceso de prácticas o vinculación'
-        if imp_col in data.columns:
-            improvement_text = ' '.join(data[imp_col].dropna())
-            if improvement_text.strip():
-                wordcloud = WordCloud(width=800, height=400, background_color='white', 
-                                    stopwords=stop_words_spanish).generate(improvement_text)
-                wordcloud.to_file(os.path.join(output_dir, f'wordcloud_improvement_{periodo}.png'))
-
-    def create_beneficiary_document(self, output_dir, periodo):
-        """Crea documento Word con los gráficos"""
+        for nombre, columna, prefijo in (('Aspectos positivos', pos_col, 'wordcloud_positive'),
+                                         ('Aspectos a mejorar', imp_col, 'wordcloud_improvement')):
+            if not opciones['nubes'] or columna not in data.columns:
+                continue
+            terminos = self.data_store.get_or_build(
+                f"terminos_{prefijo}_{periodo}",
+                lambda columna=columna: self.term_store.frequencies(data[columna]),
+                depende_de=('encuesta',))
+            if not terminos.empty:
+                agregar(nombre, nombre, render_wordcloud, dict(zip(terminos['forma'], terminos['frecuencia'].tolist())),
+                        f'{prefijo}_{periodo}', 'png', [f for f in opciones['vectoriales'] if f == 'svg'], {})
+        
+        reutilizados = set()
+        
+        def al_terminar(nombre, segundos, desde_cache):
+            print(f"  🖼️ {nombre}: {segundos:.1f}s{' (caché)' if desde_cache else ''}")
+            if desde_cache:
+                reutilizados.add(nombre)
+            self.jobs.check_cancelled()
+        
+        # Cada gráfico es independiente: los que no están en caché se dibujan en paralelo
+        inicio = time.perf_counter()
+        try:
+            resultados = render_charts(tareas, self.get_render_pool(len(tareas)), al_terminar, self.render_cache)
+        except BrokenProcessPool:
+            print("⚠️ El grupo de procesos falló, se dibujan los gráficos en este proceso")
+            self.render_pool = None
+            resultados = render_charts(tareas, None, al_terminar, self.render_cache)
+        total = time.perf_counter() - inicio
+        
+        tiempos = ", ".join(f"{nombre} {'en caché' if nombre in reutilizados else f'{segundos:.1f}s'}"
+                            for nombre, (_, segundos) in resultados.items())
+        self.update_status(f"Gráficos ({perfil}) generados en {total:.1f}s ({tiempos})")
+        
+        imagenes, archivos = {}, []
+        for nombre, (contenido, _) in resultados.items():
+            seccion, archivo = destinos[nombre]
+            if seccion is not None:
+                imagenes.setdefault(seccion, []).append(contenido)
+            if exportar:
+                write_atomic(archivo, contenido)
+                archivos.append(archivo)
+        return imagenes, archivos
+
+    def create_beneficiary_document(self, output_dir, periodo, imagenes, perfil='impresion'):
+        """Crea documento Word con las imágenes en memoria de cada sección"""
+        sufijo = PERFILES_RENDER[perfil]['sufijo']
         doc = Document()
         doc.add_heading('Análisis de Encuesta - Beneficiarios', 0)
         doc.add_paragraph(f'Período: {periodo}')
+        if perfil == 'borrador':
+            doc.add_paragraph('Borrador: gráficos en baja resolución y sin nubes de palabras')
         
-        # Lista de imágenes a incluir
+        # Secciones a incluir (con varias imágenes si el gráfico se paginó)
         images = [
-            ('Distribución por Ciudad', f'ciudad_distribution_{periodo}.jpg'),
-            ('Distribución por Institución', f'institucion_distribution_{periodo}.jpg'),
-            ('Aspectos Positivos', f'wordcloud_positive_{periodo}.png'),
-            ('Aspectos a Mejorar', f'wordcloud_improvement_{periodo}.png')
+            ('Distribución por Ciudad', 'Ciudad'),
+            ('Distribución por Institución', 'Institución'),
+            ('Aspectos Positivos', 'Aspectos positivos'),
+            ('Aspectos a Mejorar', 'Aspectos a mejorar')
         ]
         
-        for title, filename in images:
-            filepath = os.path.join(output_dir, filename)
-            if os.path.exists(filepath):
+        for title, seccion in images:
+            if imagenes.get(seccion):
                 doc.add_heading(title, level=1)
-                doc.add_picture(filepath, width=Inches(6.0))
+                for contenido in imagenes[seccion]:
+                    doc.add_picture(io.BytesIO(contenido), width=Inches(6.0))
         
         # Guardar documento
-        word_filename = os.path.join(output_dir, f'Beneficiarios_analisis_{periodo}.docx')
+        word_filename = os.path.join(output_dir, f'Beneficiarios_analisis_{periodo}{sufijo}.docx')
         doc.save(word_filename)
+        return word_filename
 
     def generate_official_documents(self):
         """Genera oficios institucionales - CORREGIDO PARA USAR SOLO INSTITUCIONES DEL PERÍODO"""
-        periodo = self.period_entry.get()
+        periodo = self.ui(self.period_entry.get)
         if not self.validate_period(periodo):
-            messagebox.showerror("Error", "Formato de período inválido. Use el formato YYYY-Q")
+            self.ui(messagebox.showerror, "Error", "Formato de período inválido. Use el formato YYYY-Q")
             return
         
         # Verificar si existe el archivo plantilla
         plantilla_path = "Formato Oficio - Editable.docx"
         if not os.path.exists(plantilla_path):
-            messagebox.showerror("Error", f"No se encontró el archivo plantilla: {plantilla_path}")
+            self.ui(messagebox.showerror, "Error", f"No se encontró el archivo plantilla: {plantilla_path}")
             return
         
         # Verificar si existe el reporte unificado consolidado
         reporte_path = os.path.join(self.directorio_destino, f"Reporte_Unificado_Consolidado_{periodo}.xlsx")
         if not os.path.exists(reporte_path):
-            respuesta = messagebox.askyesno("Reporte no encontrado", 
+            respuesta = self.ui(messagebox.askyesno, "Reporte no encontrado", 
                                           f"No se encontró el reporte unificado consolidado para {periodo}.\n¿Desea generarlo primero?")
             if respuesta:
                 self.generate_unified_consolidated_report()
@@ -778,23 +2816,24 @@ class UnifiedReportApp:
                 return
             
             # CORRECCIÓN PRINCIPAL: Filtrar instituciones por período ANTES de generar oficios
-            if 'Período' in df_datos.columns:
-                # Convertir la columna Período a formato YYYY-Q
-                df_datos['Período_Convertido'] = df_datos['Período'].apply(self.convert_timestamp_to_period)
-                print(f"Períodos únicos en instituciones: {df_datos['Período_Convertido'].unique()}")
+            if 'Período_Convertido' in df_datos.columns:
+                # La columna Período ya viene convertida a formato YYYY-Q desde la instantánea
+                particion_datos = self.get_partition('datos')
+                print(f"Períodos únicos en instituciones: {particion_datos.periodos()}")
                 
                 # Filtrar instituciones por período
-                df_datos_filtrado = df_datos[df_datos['Período_Convertido'] == periodo]
+                df_datos_filtrado = particion_datos.select(periodo)
                 print(f"✅ Instituciones filtradas para {periodo}: {len(df_datos_filtrado)}")
                 
                 if df_datos_filtrado.empty:
-                    messagebox.showwarning("Sin instituciones", f"No se encontraron instituciones para el período {periodo}")
+                    self.ui(messagebox.showwarning, "Sin instituciones", f"No se encontraron instituciones para el período {periodo}")
                     return
             else:
                 print("⚠️ No se encontró columna 'Período' en instituciones, usando todas las instituciones")
                 df_datos_filtrado = df_datos
             
             # Cargar reporte unificado consolidado
+            self.jobs.stage("Leyendo reporte consolidado")
             beneficiarios_df = pd.read_excel(reporte_path, sheet_name="Beneficiarios")
             actividades_df = pd.read_excel(reporte_path, sheet_name="Actividades")
             
@@ -803,7 +2842,7 @@ class UnifiedReportApp:
             os.makedirs(carpeta_oficios, exist_ok=True)
             
             # Opciones para generar oficios
-            opcion = messagebox.askyesno("Generar Oficios", 
+            opcion = self.ui(messagebox.askyesno, "Generar Oficios", 
                                        f"¿Desea generar oficios para TODAS las instituciones del período {periodo}?\n\n" +
                                        f"Instituciones encontradas: {len(df_datos_filtrado)}\n\n" +
                                        "Sí = Todas las instituciones del período\n" + 
@@ -814,45 +2853,97 @@ class UnifiedReportApp:
                 self.generate_all_official_documents(df_datos_filtrado, beneficiarios_df, actividades_df, carpeta_oficios, periodo)
             else:
                 # Generar para una institución específica DEL PERÍODO
-                self.generate_single_official_document(df_datos_filtrado, beneficiarios_df, actividades_df, carpeta_oficios, periodo)
+                self.ui(self.generate_single_official_document, df_datos_filtrado, beneficiarios_df, actividades_df, carpeta_oficios, periodo)
                 
         except Exception as e:
             self.update_status("Error generando oficios", "red")
-            messagebox.showerror("Error", f"Error: {str(e)}")
+            self.ui(messagebox.showerror, "Error", f"Error: {str(e)}")
 
     def generate_all_official_documents(self, df_datos_filtrado, beneficiarios_df, actividades_df, carpeta_oficios, periodo):
-        """Genera oficios para todas las instituciones DEL PERÍODO FILTRADO"""
+        """Genera oficios para todas las instituciones DEL PERÍODO FILTRADO, repartidos en varios procesos"""
         # CORRECCIÓN: Usar df_datos_filtrado en lugar de df_datos
         instituciones = df_datos_filtrado['Nombre Completo de la Institución'].dropna().unique()
-        count = 0
         
         print(f"🏢 Generando oficios para {len(instituciones)} instituciones del período {periodo}")
+        self.jobs.stage("Emparejando instituciones")
+        coincidencias = self.alias_instituciones.match_all(instituciones, beneficiarios_df['Centro de Educación'])
+        plantilla = self.get_oficio_template()
         
+        # Primera fila de cada institución y de cada centro (la misma que toma create_official_document)
+        filas_instituciones = df_datos_filtrado.drop_duplicates('Nombre Completo de la Institución').set_index(
+            'Nombre Completo de la Institución', drop=False)
+        filas_beneficiarios = beneficiarios_df.drop_duplicates('Centro de Educación').set_index(
+            'Centro de Educación', drop=False)
+        filas_actividades = actividades_df.drop_duplicates('Centro de Educación').set_index(
+            'Centro de Educación', drop=False)
+        
+        # El número de oficio es la posición de la institución en el período, se genere o no
+        self.jobs.stage("Preparando oficios")
+        tareas, omitidas, fallidas = [], {}, {}
         for idx, nombre_institucion in enumerate(instituciones, start=1):
+            self.jobs.check_cancelled()
+            nombre_coincidencia, score, aceptada = coincidencias[nombre_institucion]
+            if not aceptada:  # Solo procesar si hay buena coincidencia o está fijada
+                omitidas[nombre_institucion] = score
+                continue
             try:
-                # Buscar coincidencia en beneficiarios
-                nombre_coincidencia, score = process.extractOne(
-                    nombre_institucion, 
-                    beneficiarios_df['Centro de Educación'].dropna().tolist()
-                )
-                
-                print(f"  {idx}. {nombre_institucion} → {nombre_coincidencia} (score: {score})")
-                
-                if score > 60:  # Solo procesar si hay buena coincidencia
-                    self.create_official_document(
-                        nombre_institucion, nombre_coincidencia, idx, 
-                        df_datos_filtrado, beneficiarios_df, actividades_df, carpeta_oficios, periodo
-                    )
-                    count += 1
-                else:
-                    print(f"    ⚠️ Score muy bajo ({score}), omitiendo institución")
-                    
+                reemplazos = self.build_oficio_replacements(
+                    filas_instituciones.loc[nombre_institucion], filas_beneficiarios.loc[nombre_coincidencia],
+                    filas_actividades.loc[nombre_coincidencia], detalle=False)
+            except KeyError:
+                fallidas[nombre_institucion] = f"'{nombre_coincidencia}' no está en el reporte consolidado"
+                continue
             except Exception as e:
-                print(f"❌ Error procesando {nombre_institucion}: {e}")
+                fallidas[nombre_institucion] = str(e)
                 continue
+            tareas.append((nombre_institucion, reemplazos,
+                           os.path.join(carpeta_oficios, self.oficio_filename(nombre_institucion, idx, periodo))))
         
-        self.update_status(f"Se generaron {count} oficios en: {carpeta_oficios}", "green")
-        messagebox.showinfo("Éxito", f"Se generaron {count} oficios institucionales para el período {periodo}")
+        procesos = min(8, os.cpu_count() or 1)
+        self.jobs.stage(f"Generando oficios ({procesos} {'procesos' if procesos > 1 else 'proceso'})")
+        por_proceso = {}
+        terminadas = set()
+        
+        def al_terminar(nombre, proceso, segundos, error):
+            terminadas.add(nombre)
+            if error:
+                fallidas[nombre] = error
+                print(f"❌ Error procesando {nombre}: {error}")
+            else:
+                por_proceso[proceso] = por_proceso.get(proceso, 0) + 1
+            avance = " · ".join(f"P{numero}: {cantidad}"
+                                for numero, cantidad in enumerate(por_proceso.values(), start=1))
+            self.update_status(f"Generando oficios {len(terminadas)}/{len(tareas)} ({avance})")
+            self.jobs.check_cancelled()
+        
+        inicio = time.perf_counter()
+        try:
+            generate_oficios(tareas, plantilla, procesos, al_terminar)
+        except BrokenProcessPool:
+            print("⚠️ El grupo de procesos falló, se generan los oficios restantes en este proceso")
+            generate_oficios([tarea for tarea in tareas if tarea[0] not in terminadas], plantilla, 1, al_terminar)
+        total = time.perf_counter() - inicio
+        generados = sum(por_proceso.values())
+        
+        # Resumen final
+        print(f"📊 Oficios {periodo}: {generados} generados, {len(omitidas)} omitidos, "
+              f"{len(fallidas)} fallidos en {total:.1f}s")
+        for nombre, score in omitidas.items():
+            print(f"  ⚠️ Omitida (score {score}): {nombre}")
+        for nombre, error in fallidas.items():
+            print(f"  ❌ Fallida: {nombre}: {error}")
+        
+        resumen = (f"Oficios institucionales del período {periodo}:\n\n"
+                   f"Generados: {generados}\n"
+                   f"Omitidos (sin coincidencia en el reporte): {len(omitidas)}\n"
+                   f"Fallidos: {len(fallidas)}")
+        if fallidas:
+            resumen += "\n\n" + "\n".join(f"• {nombre}: {error}" for nombre, error in list(fallidas.items())[:10])
+            if len(fallidas) > 10:
+                resumen += f"\n... y {len(fallidas) - 10} más (ver consola)"
+        self.update_status(f"Se generaron {generados} oficios en: {carpeta_oficios} ({total:.1f}s)",
+                           "orange" if fallidas else "green")
+        self.ui(messagebox.showwarning if fallidas else messagebox.showinfo, "Oficios generados", resumen)
 
     def generate_single_official_document(self, df_datos_filtrado, beneficiarios_df, actividades_df, carpeta_oficios, periodo):
         """Genera oficio para una institución específica DEL PERÍODO FILTRADO"""
@@ -881,10 +2972,12 @@ class UnifiedReportApp:
             selection = listbox.curselection()
             if selection:
                 nombre_institucion = listbox.get(selection[0])
-                nombre_coincidencia, _ = process.extractOne(
-                    nombre_institucion, 
-                    beneficiarios_df['Centro de Educación'].dropna().tolist()
-                )
+                nombre_coincidencia, _, _ = self.alias_instituciones.match_all(
+                    [nombre_institucion], beneficiarios_df['Centro de Educación'])[nombre_institucion]
+                if nombre_coincidencia is None:
+                    messagebox.showwarning("Sin coincidencia", 
+                                           f"La institución no tiene un centro asignado en el reporte: {nombre_institucion}")
+                    return
                 
                 self.create_official_document(
                     nombre_institucion, nombre_coincidencia, 1,
@@ -899,86 +2992,174 @@ class UnifiedReportApp:
         
         tk.Button(selection_window, text="Generar Oficio", command=generar_seleccionado).pack(pady=10)
 
-    def replace_text_in_word_document(self, doc, replacements):
-        """Función robusta para reemplazar texto en documentos Word"""
-        print("🔄 Iniciando reemplazos en documento Word...")
+    def review_institution_matches(self):
+        """Ventana para revisar, fijar o corregir las coincidencias institución → centro"""
+        if self.jobs.ocupado:
+            messagebox.showwarning("Tarea en curso", f"Espere a que termine: {self.jobs.job.nombre}")
+            return
+        tabla = self.alias_instituciones
         
-        # Función auxiliar para reemplazar en runs de un párrafo
-        def replace_in_paragraph(paragraph, old_text, new_text):
-            """Reemplaza texto en un párrafo manejando runs fragmentados"""
-            if old_text in paragraph.text:
-                # Obtener el texto completo del párrafo
-                full_text = paragraph.text
-                
-                # Si contiene el marcador, reemplazar
-                if old_text in full_text:
-                    new_full_text = full_text.replace(old_text, new_text)
-                    
-                    # Limpiar todos los runs existentes
-                    for run in paragraph.runs:
-                        run.text = ""
-                    
-                    # Crear un nuevo run con el texto reemplazado
-                    if paragraph.runs:
-                        paragraph.runs[0].text = new_full_text
-                    else:
-                        paragraph.add_run(new_full_text)
-                    
-                    print(f"  ✅ Reemplazado '{old_text}' → '{new_text}' en párrafo")
-                    return True
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Coincidencias de Instituciones")
+        ventana.geometry("800x500")
+        
+        columnas = ('institucion', 'centro', 'puntaje', 'estado')
+        arbol = ttk.Treeview(ventana, columns=columnas, show='headings')
+        for columna, titulo, ancho in zip(columnas, ("Institución", "Centro de Educación", "Puntaje", "Estado"),
+                                          (300, 300, 70, 110)):
+            arbol.heading(columna, text=titulo)
+            arbol.column(columna, width=ancho, anchor='w')
+        scrollbar = ttk.Scrollbar(ventana, orient="vertical", command=arbol.yview)
+        arbol.configure(yscrollcommand=scrollbar.set)
+        
+        def cargar():
+            arbol.delete(*arbol.get_children())
+            for clave, entrada in sorted(tabla.alias.items(), key=lambda item: item[1]['puntaje']):
+                if entrada['fijado']:
+                    estado = "Fijada" if entrada['centro'] else "Sin coincidencia"
+                else:
+                    estado = "Aceptada" if entrada['puntaje'] > tabla.UMBRAL else "Dudosa"
+                arbol.insert('', tk.END, iid=clave, values=(
+                    entrada['institucion'], tabla.centros.get(entrada['centro'], ''), entrada['puntaje'], estado))
+        
+        controles = tk.Frame(ventana)
+        controles.pack(side=tk.BOTTOM, fill='x', pady=5)
+        tk.Label(controles, text="Centro:").pack(side=tk.LEFT, padx=5)
+        centro_var = tk.StringVar()
+        ttk.Combobox(controles, textvariable=centro_var, values=sorted(tabla.centros.values()),
+                     width=40).pack(side=tk.LEFT, padx=5)
+        
+        def tarea_en_curso():
+            # match_all modifica y guarda la misma tabla desde el hilo de trabajo
+            if self.jobs.ocupado:
+                messagebox.showwarning("Tarea en curso", f"Espere a que termine: {self.jobs.job.nombre}",
+                                       parent=ventana)
+                return True
             return False
         
-        # Función auxiliar para reemplazar en celdas de tabla
-        def replace_in_cell(cell, old_text, new_text):
-            """Reemplaza texto en una celda de tabla"""
-            replaced = False
-            for paragraph in cell.paragraphs:
-                if replace_in_paragraph(paragraph, old_text, new_text):
-                    replaced = True
-            return replaced
-        
-        # Contador de reemplazos realizados
-        total_replacements = 0
-        
-        # Realizar reemplazos
-        for old_text, new_text in replacements.items():
-            replacements_for_this_marker = 0
-            
-            # 1. Reemplazar en párrafos principales
-            for paragraph in doc.paragraphs:
-                if replace_in_paragraph(paragraph, old_text, new_text):
-                    replacements_for_this_marker += 1
-            
-            # 2. Reemplazar en tablas
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if replace_in_cell(cell, old_text, new_text):
-                            replacements_for_this_marker += 1
-            
-            # 3. Reemplazar en headers y footers
-            for section in doc.sections:
-                # Header
-                if section.header:
-                    for paragraph in section.header.paragraphs:
-                        if replace_in_paragraph(paragraph, old_text, new_text):
-                            replacements_for_this_marker += 1
-                
-                # Footer
-                if section.footer:
-                    for paragraph in section.footer.paragraphs:
-                        if replace_in_paragraph(paragraph, old_text, new_text):
-                            replacements_for_this_marker += 1
-            
-            total_replacements += replacements_for_this_marker
-            
-            if replacements_for_this_marker > 0:
-                print(f"  ✅ '{old_text}' → '{new_text}' ({replacements_for_this_marker} reemplazos)")
+        def seleccionada():
+            seleccion = arbol.selection()
+            if not seleccion:
+                messagebox.showwarning("Selección", "Por favor seleccione una institución", parent=ventana)
+                return None
+            return tabla.alias[seleccion[0]]['institucion']
+        
+        def al_seleccionar(event):
+            seleccion = arbol.selection()
+            if seleccion:
+                centro_var.set(tabla.centros.get(tabla.alias[seleccion[0]]['centro'], ''))
+        
+        def fijar(sin_coincidencia=False):
+            if tarea_en_curso():
+                return
+            institucion = seleccionada()
+            if institucion is None:
+                return
+            centro = None if sin_coincidencia else centro_var.get().strip()
+            if not sin_coincidencia and not centro:
+                messagebox.showwarning("Centro", "Seleccione el centro de educación", parent=ventana)
+                return
+            tabla.pin(institucion, centro)
+            cargar()
+        
+        def quitar():
+            if tarea_en_curso():
+                return
+            institucion = seleccionada()
+            if institucion is not None:
+                tabla.unpin(institucion)
+                cargar()
+        
+        arbol.bind('<<TreeviewSelect>>', al_seleccionar)
+        botones = [tk.Button(controles, text="Fijar", command=fijar),
+                   tk.Button(controles, text="Sin coincidencia", command=lambda: fijar(True)),
+                   tk.Button(controles, text="Recalcular", command=quitar)]
+        for boton in botones:
+            boton.pack(side=tk.LEFT, padx=2)
+        
+        def actualizar_botones(ocupado_antes=False):
+            # Los cambios quedan deshabilitados mientras haya una tarea en curso;
+            # al terminar se recarga la tabla por si la tarea volvió a emparejar
+            if not ventana.winfo_exists():
+                return
+            ocupado = self.jobs.ocupado
+            for boton in botones:
+                boton.config(state=tk.DISABLED if ocupado else tk.NORMAL)
+            if ocupado_antes and not ocupado:
+                cargar()
+            ventana.after(500, actualizar_botones, ocupado)
+        
+        arbol.pack(side="left", fill="both", expand=True, padx=10, pady=5)
+        scrollbar.pack(side="right", fill="y")
+        cargar()
+        actualizar_botones()
+
+    def build_oficio_replacements(self, row_institucion, row_beneficiarios, row_actividades, detalle=True):
+        """Valores de los marcadores del oficio de una institución"""
+        log = print if detalle else (lambda *args: None)
+        
+        # Buscar la columna correcta del representante
+        col_representante = None
+        for col in row_institucion.index:
+            if 'rector' in col.lower() and 'autoridad' in col.lower():
+                col_representante = col
+                log(f"✅ Encontrada columna de representante: '{col}'")
+                break
+        
+        if not col_representante:
+            log("❌ No se encontró columna de representante")
+            nombre_representante = "No disponible"
+        else:
+            nombre_representante = str(row_institucion.get(col_representante, "")).strip()
+            log(f"👤 Nombre del representante obtenido: '{nombre_representante}'")
+        
+        # Obtener supervisor desde la columna "Supervisor"
+        supervisor_proyecto = "Mg. Guillermo Andrade"  # Valor por defecto
+        if 'Supervisor' in row_institucion.index:
+            supervisor_desde_bd = str(row_institucion.get('Supervisor', "")).strip()
+            if supervisor_desde_bd and supervisor_desde_bd.lower() not in ['nan', 'none', '']:
+                supervisor_proyecto = supervisor_desde_bd
+                log(f"👨‍🏫 Supervisor obtenido desde BD: '{supervisor_proyecto}'")
             else:
-                print(f"  ⚠️ '{old_text}' no encontrado en el documento")
+                log(f"⚠️ Supervisor vacío en BD, usando valor por defecto: '{supervisor_proyecto}'")
+        else:
+            log(f"❌ No se encontró columna 'Supervisor', usando valor por defecto: '{supervisor_proyecto}'")
         
-        print(f"🎯 Total de reemplazos realizados: {total_replacements}")
-        return total_replacements
+        # Definir reemplazos usando los nombres correctos de columnas
+        return {
+            # Limpiar marcador duplicado en el número de oficio
+            "[Número de Oficio]": "",
+            
+            # Datos de la institución desde Google Sheets
+            "[Título del representante de la institución]": str(row_institucion.get("Título del Rector o Autoridad", "")).strip(),
+            "[Nombre del Representante de la institucion]": nombre_representante,
+            "[Cargo del representante]": str(row_institucion.get("Cargo", "")).strip(),
+            "[Nombre Completo de la Institución]": str(row_institucion.get("Nombre Completo de la Institución", "")).title(),
+            
+            # Datos del reporte consolidado
+            "[Número de Capacitaciones Funcionarios]": str(int(row_actividades.get("Capacitaciones Funcionarios", 0))),
+            "[Número de Funcionarios Capacitados]": str(int(row_actividades.get("Capacitaciones Funcionarios", 0))),
+            "[Número de Capacitaciones Padres]": str(int(row_actividades.get("Capacitaciones Padres", 0))),
+            "[Número de Padres Capacitados]": str(int(row_beneficiarios.get("Padres y Cuidadores Capacitados", 0))),
+            "[Número de Sensibilizaciones]": str(int(row_actividades.get("Sensibilizaciones", 0))),
+            "[Número de Personas Sensibilizadas]": str(int(row_beneficiarios.get("Personas Sensibilizadas", 0))),
+            "[Número de Asesorías]": str(int(row_beneficiarios.get("Asesorías", 0))),
+            "[Atenciones Individuales]": str(int(row_beneficiarios.get("Atenciones Individuales", 0))),
+            "[Estudiantes DIAC]": str(int(row_beneficiarios.get("DIAC", 0))),
+            "[Evaluaciones Psicopedagógicas]": str(int(row_beneficiarios.get("Evaluaciones Psicopedagógicas", 0))),
+            
+            # Datos adicionales
+            "[Fecha]": date.today().strftime("%d de %B de %Y"),
+            
+            # Datos del proyecto
+            "[Proyecto]": str(row_institucion.get("Proyecto", "Espacios de Apoyo Pedagógico Inclusivo")),
+            "[Supervisor del Proyecto]": supervisor_proyecto,
+        }
+
+    def oficio_filename(self, nombre_institucion, numero_oficio, periodo):
+        """Nombre del archivo del oficio (depende solo de la institución, su número y el período)"""
+        nombre_archivo = self.clean_filename(nombre_institucion)
+        return f"Oficio_{nombre_archivo.replace(' ', '_')}_No_{numero_oficio:05d}_{periodo}.docx"
 
     def create_official_document(self, nombre_institucion, nombre_coincidencia, numero_oficio, 
                                df_datos_filtrado, beneficiarios_df, actividades_df, carpeta_oficios, periodo):
@@ -995,83 +3176,22 @@ class UnifiedReportApp:
             print(f"📋 Datos de beneficiarios encontrados: {dict(row_beneficiarios)}")
             print(f"📋 Datos de actividades encontrados: {dict(row_actividades)}")
             
-            # Cargar plantilla
-            plantilla_path = "Formato Oficio - Editable.docx"
-            nuevo_doc = Document(plantilla_path)
-            
-            # Buscar la columna correcta del representante
-            col_representante = None
-            for col in df_datos_filtrado.columns:
-                if 'rector' in col.lower() and 'autoridad' in col.lower():
-                    col_representante = col
-                    print(f"✅ Encontrada columna de representante: '{col}'")
-                    break
-            
-            if not col_representante:
-                print("❌ No se encontró columna de representante")
-                nombre_representante = "No disponible"
-            else:
-                nombre_representante = str(row_institucion.get(col_representante, "")).strip()
-                print(f"👤 Nombre del representante obtenido: '{nombre_representante}'")
-            
-            # Obtener supervisor desde la columna "Supervisor"
-            supervisor_proyecto = "Mg. Guillermo Andrade"  # Valor por defecto
-            if 'Supervisor' in df_datos_filtrado.columns:
-                supervisor_desde_bd = str(row_institucion.get('Supervisor', "")).strip()
-                if supervisor_desde_bd and supervisor_desde_bd.lower() not in ['nan', 'none', '']:
-                    supervisor_proyecto = supervisor_desde_bd
-                    print(f"👨‍🏫 Supervisor obtenido desde BD: '{supervisor_proyecto}'")
-                else:
-                    print(f"⚠️ Supervisor vacío en BD, usando valor por defecto: '{supervisor_proyecto}'")
-            else:
-                print(f"❌ No se encontró columna 'Supervisor', usando valor por defecto: '{supervisor_proyecto}'")
-            
-            # Definir reemplazos usando los nombres correctos de columnas
-            reemplazos = {
-                # Limpiar marcador duplicado en el número de oficio
-                "[Número de Oficio]": "",
-                
-                # Datos de la institución desde Google Sheets
-                "[Título del representante de la institución]": str(row_institucion.get("Título del Rector o Autoridad", "")).strip(),
-                "[Nombre del Representante de la institucion]": nombre_representante,
-                "[Cargo del representante]": str(row_institucion.get("Cargo", "")).strip(),
-                "[Nombre Completo de la Institución]": str(row_institucion.get("Nombre Completo de la Institución", "")).title(),
-                
-                # Datos del reporte consolidado
-                "[Número de Capacitaciones Funcionarios]": str(int(row_actividades.get("Capacitaciones Funcionarios", 0))),
-                "[Número de Funcionarios Capacitados]": str(int(row_actividades.get("Capacitaciones Funcionarios", 0))),
-                "[Número de Capacitaciones Padres]": str(int(row_actividades.get("Capacitaciones Padres", 0))),
-                "[Número de Padres Capacitados]": str(int(row_beneficiarios.get("Padres y Cuidadores Capacitados", 0))),
-                "[Número de Sensibilizaciones]": str(int(row_actividades.get("Sensibilizaciones", 0))),
-                "[Número de Personas Sensibilizadas]": str(int(row_beneficiarios.get("Personas Sensibilizadas", 0))),
-                "[Número de Asesorías]": str(int(row_beneficiarios.get("Asesorías", 0))),
-                "[Atenciones Individuales]": str(int(row_beneficiarios.get("Atenciones Individuales", 0))),
-                "[Estudiantes DIAC]": str(int(row_beneficiarios.get("DIAC", 0))),
-                "[Evaluaciones Psicopedagógicas]": str(int(row_beneficiarios.get("Evaluaciones Psicopedagógicas", 0))),
-                
-                # Datos adicionales
-                "[Fecha]": date.today().strftime("%d de %B de %Y"),
-                
-                # Datos del proyecto
-                "[Proyecto]": str(row_institucion.get("Proyecto", "Espacios de Apoyo Pedagógico Inclusivo")),
-                "[Supervisor del Proyecto]": supervisor_proyecto,
-            }
+            # Plantilla compilada una sola vez por sesión
+            plantilla = self.get_oficio_template()
+            reemplazos = self.build_oficio_replacements(row_institucion, row_beneficiarios, row_actividades)
             
             # Mostrar información de depuración
             print(f"🔄 Reemplazos definidos para {nombre_institucion}:")
             for marcador, valor in reemplazos.items():
                 print(f"  {marcador} → '{valor}'")
-            
-            # Usar la función de reemplazo robusta
-            total_reemplazos = self.replace_text_in_word_document(nuevo_doc, reemplazos)
-            
-            # Generar nombre de archivo
-            nombre_archivo = self.clean_filename(nombre_institucion)
-            output_filename = f"Oficio_{nombre_archivo.replace(' ', '_')}_No_{numero_oficio:05d}_{periodo}.docx"
-            output_filepath = os.path.join(carpeta_oficios, output_filename)
-            
-            # Guardar documento
-            nuevo_doc.save(output_filepath)
+            for marcador in sorted(set(reemplazos) - plantilla.marcadores):
+                print(f"  ⚠️ '{marcador}' no encontrado en el documento")
+            
+            # Rellenar los marcadores de la plantilla en una sola pasada y guardar
+            output_filepath = os.path.join(carpeta_oficios, self.oficio_filename(nombre_institucion, numero_oficio, periodo))
+            write_oficio(plantilla, reemplazos, output_filepath)
+            total_reemplazos = sum(marcador in reemplazos for huecos in plantilla.huecos.values()
+                                   for _, marcadores in huecos for marcador in marcadores)
             print(f"✅ Documento generado exitosamente: {output_filepath}")
             print(f"📊 Total de reemplazos realizados: {total_reemplazos}")
             